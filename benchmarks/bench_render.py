@@ -0,0 +1,42 @@
+"""
+Throughput benchmark of facility rendering: jinja templates against the
+FastTemplate fast path of from_pris.reactor_stream.
+
+Usage: python benchmarks/bench_render.py [number_of_reactors]
+"""
+import os
+import sys
+import time
+import numpy as np
+import cyclus_input_gen.from_pris as fp
+
+dir = os.path.dirname(__file__)
+database_path = os.path.join(dir, '..', 'database', 'reactors_pris_2016.csv')
+
+
+def synthetic_fleet(n_reactors):
+    """ Tiles the PRIS database into a fleet of n_reactors reactors."""
+    reactor_array = fp.read_csv(database_path, None)
+    repeats = -(-n_reactors // len(reactor_array))
+    return np.tile(reactor_array, repeats)[:n_reactors]
+
+
+def time_render(reactor_array, fast, is_cyborg=False):
+    """ Renders the facility blocks and returns output and seconds."""
+    start = time.perf_counter()
+    output = ''.join(fp.reactor_stream(reactor_array, is_cyborg, fast))
+    return output, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n_reactors = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    reactor_array = synthetic_fleet(n_reactors)
+    for is_cyborg in (False, True):
+        jinja_output, jinja_time = time_render(reactor_array, False,
+                                               is_cyborg)
+        fast_output, fast_time = time_render(reactor_array, True, is_cyborg)
+        assert fast_output == jinja_output
+        print('%s: %i facilities, jinja %.0f/s, fast %.0f/s (%.1fx)'
+              % ('cyborg' if is_cyborg else 'cycamore', n_reactors,
+                 n_reactors / jinja_time, n_reactors / fast_time,
+                 jinja_time / fast_time))
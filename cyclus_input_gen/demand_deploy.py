@@ -1,5 +1,237 @@
+import ast
+import functools
+import multiprocessing
 import numpy as np
-import parser
+from cyclus_input_gen.fleet import decode_column
+
+# functions a demand equation can call, by name or as np.<name>
+demand_functions = {'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt,
+                    'piecewise': np.piecewise, 'where': np.where,
+                    'abs': np.abs, 'minimum': np.minimum,
+                    'maximum': np.maximum}
+
+# constants a demand equation can use
+demand_constants = {'pi': np.pi, 'e': np.e}
+
+# syntax allowed in a demand equation
+demand_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare,
+                ast.Call, ast.Name, ast.Attribute, ast.Constant, ast.Load,
+                ast.List, ast.Tuple, ast.Add, ast.Sub, ast.Mult, ast.Div,
+                ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+                ast.BitAnd, ast.BitOr, ast.Invert, ast.Lt, ast.LtE,
+                ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+# largest constant exponent of a power of constants in a demand equation
+demand_max_exponent = 100
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_demand(demand_eq):
+    """ Compiles a demand equation into a function of a time array.
+
+        Equations are checked against a whitelist before compiling:
+        arithmetic and comparisons of numbers, the time `t`, the
+        constants in demand_constants, parameter names (without leading
+        underscores) and calls of the functions in demand_functions
+        (also as np.exp, etc.). A power of constants needs a literal
+        exponent of at most demand_max_exponent, and integer literals
+        are compiled as floats, so constant arithmetic cannot run away.
+        Compiled equations are cached by source string.
+
+    Parameters:
+    -----------
+    demand_eq: str
+        demand equation w.r.t time(t), e.g. '1000 * exp(0.01 * t / 12)'
+
+    Returns:
+    --------
+    demand: function
+        demand(t, **params) evaluates the equation over the array t,
+        with the other names of the equation given as params
+    """
+    tree = ast.parse(demand_eq.strip(), mode='eval')
+    # np is only allowed as np.<function>
+    np_names = set(id(node.value) for node in ast.walk(tree)
+                   if isinstance(node, ast.Attribute))
+    for node in ast.walk(tree):
+        if not isinstance(node, demand_nodes):
+            raise ValueError('%s is not allowed in a demand equation: %s'
+                             % (type(node).__name__, demand_eq))
+        if isinstance(node, ast.Constant) and (
+                isinstance(node.value, bool)
+                or not isinstance(node.value, (int, float))):
+            raise ValueError('only numbers are allowed in a demand '
+                             'equation: %s' % demand_eq)
+        if isinstance(node, ast.Name) and not (
+                node.id in demand_functions or node.id in demand_constants
+                or (node.id == 'np' and id(node) in np_names)
+                or (node.id != 'np' and not node.id.startswith('_'))):
+            raise ValueError('%s is not allowed in a demand equation: %s'
+                             % (node.id, demand_eq))
+        if isinstance(node, ast.Attribute) and not (
+                isinstance(node.value, ast.Name) and node.value.id == 'np'
+                and node.attr in demand_functions):
+            raise ValueError('.%s is not allowed in a demand equation: %s'
+                             % (node.attr, demand_eq))
+        if isinstance(node, ast.Call) and not (
+                isinstance(node.func, ast.Attribute)
+                or (isinstance(node.func, ast.Name)
+                    and node.func.id in demand_functions)):
+            raise ValueError('only %s can be called in a demand equation: %s'
+                             % (', '.join(sorted(demand_functions)),
+                                demand_eq))
+        if (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow)
+                and _is_constant(node.left) and _is_constant(node.right)):
+            exponent = node.right
+            if isinstance(exponent, ast.UnaryOp) and isinstance(
+                    exponent.op, (ast.USub, ast.UAdd)):
+                exponent = exponent.operand
+            if not (isinstance(exponent, ast.Constant)
+                    and abs(exponent.value) <= demand_max_exponent):
+                raise ValueError('constant exponents above %i are not '
+                                 'allowed in a demand equation: %s'
+                                 % (demand_max_exponent, demand_eq))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant):
+            node.value = float(node.value)
+    code = compile(tree, '<demand equation>', 'eval')
+    namespace = dict(demand_functions, **demand_constants)
+    namespace['np'] = np
+
+    def demand(t, **params):
+        reserved = set(params) & (set(namespace) | {'t'})
+        if reserved:
+            raise ValueError('%s cannot be a demand equation parameter'
+                             % ', '.join(sorted(reserved)))
+        return eval(code, {'__builtins__': {}},
+                    dict(namespace, t=t, **params))
+    return demand
+
+
+def _is_constant(node):
+    """ True if an equation node only involves numbers."""
+    return not any(isinstance(child, ast.Name) for child in ast.walk(node))
+
+
+def get_demand(demand_eq, total_steps, **params):
+    """ Evaluates a demand equation over all timesteps at once
+
+    Parameters:
+    -----------
+    demand_eq: str
+        demand equation w.r.t time(t), see compile_demand
+    total_steps: int
+        number of timesteps, t goes from 0 to total_steps - 1
+    params: float or array
+        values of the other names of the equation
+
+    Returns:
+    --------
+    demand_timeseries: array
+        demand at every timestep
+    """
+    t = np.arange(total_steps, dtype=float)
+    demand = np.asarray(compile_demand(demand_eq)(t, **params), dtype=float)
+    return np.array(np.broadcast_to(demand, np.broadcast(demand, t).shape))
+
+
+def get_power_dict(reactor_data, total_steps, field='country',
+                   institutions=None, ucf=False, default_ucf=100.0,
+                   scale=1.0):
+    """ Builds the capacity timeseries of every country (or other
+        group of reactors) of a fleet, for get_new_deployment.
+
+        Each reactor adds its capacity from its entry time for its
+        lifetime: the capacities are scattered into a difference array
+        at the start and end of every reactor and summed over time.
+
+    Parameters:
+    -----------
+    reactor_data: array or Fleet
+        reactor data with entry_time and lifetime filled in, e.g. from
+        from_pris.read_csv and from_pris.get_deployment_times
+    total_steps: int
+        number of timesteps of the timeseries
+    field: str
+        column the reactors are grouped by, e.g. 'country' or 'operator'
+    institutions: dictionary
+        key: value of field
+        value: institution name. Reactors with values of field that are
+        not listed are left out. Every value is its own institution
+        if None.
+    ucf: bool
+        if True, weights the capacities by the ucf (unit capability
+        factor [%]) column
+    default_ucf: float
+        ucf [%] of the reactors without one
+    scale: float
+        factor applied to net_elec_capacity [MWe], e.g. 0.001 for GWe
+
+    Returns:
+    --------
+    power_dict: dictionary
+        key: institution
+        value: capacity timeseries
+    """
+    # map the distinct values of field, not every reactor
+    values, value_index = np.unique(
+        decode_column(reactor_data[field]).astype(str), return_inverse=True)
+    value_index = value_index.reshape(-1)
+    if institutions is None:
+        names, inverse = values, value_index
+        listed = np.ones(len(value_index), dtype=bool)
+    else:
+        known = np.array([value in institutions for value in values],
+                         dtype=bool)
+        names, known_index = np.unique(
+            np.array([institutions[value] for value in values[known]],
+                     dtype=str), return_inverse=True)
+        name_index = np.full(len(values), -1)
+        name_index[known] = known_index.reshape(-1)
+        row_name = name_index[value_index]
+        listed = row_name >= 0
+        inverse = row_name[listed]
+    capacity = np.asarray(reactor_data['net_elec_capacity'],
+                          dtype=float)[listed] * scale
+    if ucf:
+        factor = np.asarray(reactor_data['ucf'], dtype=float)[listed]
+        capacity *= np.where(np.isnan(factor), default_ucf, factor) / 100.0
+    entry_time = np.asarray(reactor_data['entry_time'])[listed]
+    lifetime = np.asarray(reactor_data['lifetime'])[listed]
+    start = np.clip(entry_time, 0, total_steps)
+    end = np.clip(entry_time + lifetime, start, total_steps)
+
+    difference = np.zeros((len(names), total_steps + 1))
+    np.add.at(difference, (inverse, start), capacity)
+    np.add.at(difference, (inverse, end), -capacity)
+    power = np.cumsum(difference[:, :-1], axis=1)
+    return {str(name): power[indx] for indx, name in enumerate(names)}
+
+
+def existing_power(power_dict, inst_list, total_steps):
+    """ Sums the capacity timeseries of the institutions taken into
+        account
+
+    Parameters:
+    -----------
+    power_dict: dictionary
+        key: institution
+        value: capacity timeseries
+    inst_list: list
+        list of institution names to take into account
+    total_steps: int
+        length of the capacity timeseries
+
+    Returns:
+    --------
+    total_power: array
+        total capacity timeseries
+    """
+    total_power = np.zeros(total_steps)
+    for key, val in power_dict.items():
+        if key in inst_list:
+            total_power += np.array(val)
+    return total_power
 
 
 def get_new_deployment(power_dict, inst_list, demand_eq, new_reactor_power,
@@ -14,7 +246,7 @@ def get_new_deployment(power_dict, inst_list, demand_eq, new_reactor_power,
     inst_list: list
         list of institution names to take into account
     demand_eq: str
-        demand equation w.r.t time(t)
+        demand equation w.r.t time(t), see compile_demand
     new_reactor_power: int
         new reactor power capacity [GWe]
     new_reactor_lifetime: int
@@ -31,41 +263,329 @@ def get_new_deployment(power_dict, inst_list, demand_eq, new_reactor_power,
     """
     # get total power generated
     total_steps = len(power_dict[inst_list[0]])
-    total_power = np.zeros(total_steps)
-    for key, val in power_dict.items():
-        if key in inst_list:
-            total_power += np.array(val)
+    total_power = existing_power(power_dict, inst_list, total_steps)
 
     # get lacking from power demand
-    eq = parser.expr(demand_eq).compile()
-    demand_timeseries = np.zeros(total_steps)
-    for indx, value in enumerate(demand_timeseries):
-        t = indx
-        demand_timeseries[indx] = eval(eq)
+    demand_timeseries = get_demand(demand_eq, total_steps)
 
     total_lack = demand_timeseries - total_power
+    steps = np.arange(total_steps)
+    if new:
+        available = steps >= avail_timestep
+    else:
+        available = steps < avail_timestep
+    return deployment_sweep(total_lack, new_reactor_power,
+                            new_reactor_lifetime, available)
+
+
+def deployment_sweep(total_lack, new_reactor_power, new_reactor_lifetime,
+                     available):
+    """ Deploys reactors to cover the lack of power, in one pass over
+        time.
+
+        At every timestep but the first, if the remaining lack is larger
+        than the reactor power, lack // power reactors are deployed for
+        their lifetime. The reactors running at each timestep are kept as
+        a running count, with the retirements in a difference array, so
+        each timestep costs O(1) whatever the lifetime.
+
+    Parameters:
+    -----------
+    total_lack: array
+        power demand minus existing capacity timeseries
+    new_reactor_power: float
+        new reactor power capacity [GWe]
+    new_reactor_lifetime: int
+        lifetime of new reactor
+    available: array
+        bool timeseries, True when the reactor can be deployed
+
+    Returns:
+    --------
+    deploy_array: array
+        timeseries for deploying new reactor
+    deployed_power: array
+        timeseries of the power of the deployed reactors
+    """
+    total_steps = len(total_lack)
     deploy_array = np.zeros(total_steps)
-    deployed_power = np.zeros(total_steps)
-    for indx in range(len(total_lack)):
-        # skip index 0
-        if indx == 0:
-            continue
-        if total_lack[indx] > new_reactor_power:
-            num = total_lack[indx] // new_reactor_power
-            if new and indx >= avail_timestep:
-                deploy_array[indx] = num
-                high_end = min([indx + new_reactor_lifetime, total_steps])
-                for i in range(indx, high_end):
-                    total_lack[i] -= num * new_reactor_power
-                    deployed_power[i] += num * new_reactor_power
-            elif not new and indx < avail_timestep:
-                deploy_array[indx] = num
-                high_end = min([indx + new_reactor_lifetime, total_steps])
-                for i in range(indx, high_end):
-                    total_lack[i] -= num * new_reactor_power
-                    deployed_power[i] += num * new_reactor_power
-
-    return deploy_array, deployed_power
+    n_running = np.zeros(total_steps)
+    # retiring[i]: number of deployed reactors that retire at step i
+    retiring = np.zeros(total_steps + 1)
+    running = 0.0
+    # skip index 0
+    for indx in range(1, total_steps):
+        running -= retiring[indx]
+        lack = total_lack[indx] - running * new_reactor_power
+        if available[indx] and lack > new_reactor_power:
+            num = lack // new_reactor_power
+            deploy_array[indx] = num
+            if new_reactor_lifetime > 0:
+                running += num
+                retiring[min(indx + new_reactor_lifetime,
+                             total_steps)] += num
+        n_running[indx] = running
+    return deploy_array, n_running * new_reactor_power
+
+
+def get_batch_deployment(power_dict, inst_list, demand_eq,
+                         new_reactor_power, new_reactor_lifetime,
+                         avail_timestep, new=False, processes=1,
+                         chunk_size=1000, **params):
+    """ Calculates the deployment schemes of many demand scenarios at
+        once, sweeping over time with every scenario in one array.
+
+        The reactor parameters and the params of the demand equation
+        are scalars or arrays, broadcast against each other into one
+        scenario per element. Every scenario gives the same result as
+        get_new_deployment.
+
+    Parameters:
+    -----------
+    power_dict: dictionary
+        key: institution
+        value: capacity timeseries
+    inst_list: list
+        list of institution names to take into account
+    demand_eq: str
+        demand equation w.r.t time(t) and params, see compile_demand
+    new_reactor_power: float or array
+        new reactor power capacity [GWe] of every scenario
+    new_reactor_lifetime: int or array
+        lifetime of new reactor of every scenario
+    avail_timestep: int or array
+        timestep when new reactor type is available, of every scenario
+    new: bool
+        if the reactor is new reactor type or not
+    processes: int
+        number of worker processes the scenarios are split over, in
+        chunks of chunk_size. Runs in this process if 1, uses every
+        core if None.
+    chunk_size: int
+        number of scenarios swept at a time
+    params: float or array
+        values of the other names of the demand equation, e.g.
+        growth=np.linspace(0, 0.02, 100) for '1000 * exp(growth * t)'
+
+    Returns:
+    --------
+    deploy_array: array
+        (scenario x timestep) deployment of new reactors
+    deployed_power: array
+        (scenario x timestep) power of the deployed reactors
+    """
+    total_steps = len(power_dict[inst_list[0]])
+    total_power = existing_power(power_dict, inst_list, total_steps)
+
+    names = sorted(params)
+    scenarios = np.broadcast_arrays(new_reactor_power, new_reactor_lifetime,
+                                    avail_timestep,
+                                    *[params[name] for name in names])
+    scenarios = [np.ravel(values) for values in scenarios]
+    n_scenarios = len(scenarios[0])
+    chunks = []
+    for start in range(0, n_scenarios, chunk_size):
+        chunk = [values[start:start + chunk_size] for values in scenarios]
+        chunks.append((total_power, demand_eq, new, chunk[0], chunk[1],
+                       chunk[2], dict(zip(names, chunk[3:]))))
+
+    if processes == 1 or len(chunks) <= 1:
+        results = [_batch_sweep(chunk) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_batch_sweep, chunks)
+    if not results:
+        return np.zeros((0, total_steps)), np.zeros((0, total_steps))
+    return (np.concatenate([deploy for deploy, _ in results]),
+            np.concatenate([power for _, power in results]))
+
+
+def _batch_sweep(chunk):
+    """ Sweeps one chunk of scenarios of get_batch_deployment."""
+    (total_power, demand_eq, new, new_reactor_power, new_reactor_lifetime,
+     avail_timestep, params) = chunk
+    total_steps = len(total_power)
+    params = {name: values[:, np.newaxis] for name, values in params.items()}
+    demand = get_demand(demand_eq, total_steps, **params)
+    total_lack = np.broadcast_to(demand - total_power,
+                                 (len(new_reactor_power), total_steps))
+    steps = np.arange(total_steps)
+    if new:
+        available = steps >= avail_timestep[:, np.newaxis]
+    else:
+        available = steps < avail_timestep[:, np.newaxis]
+    return deployment_sweep_batch(total_lack, new_reactor_power,
+                                  new_reactor_lifetime, available)
+
+
+def deployment_sweep_batch(total_lack, new_reactor_power,
+                           new_reactor_lifetime, available):
+    """ deployment_sweep over many scenarios at once: one pass over
+        time, with array operations across the scenarios.
+
+    Parameters:
+    -----------
+    total_lack: array
+        (scenario x timestep) power demand minus existing capacity
+    new_reactor_power: array
+        new reactor power capacity [GWe] of every scenario
+    new_reactor_lifetime: array
+        lifetime of new reactor of every scenario
+    available: array
+        (scenario x timestep) bool, True when the reactor can be deployed
+
+    Returns:
+    --------
+    deploy_array: array
+        (scenario x timestep) deployment of new reactors
+    deployed_power: array
+        (scenario x timestep) power of the deployed reactors
+    """
+    n_scenarios, total_steps = np.shape(total_lack)
+    new_reactor_power = np.asarray(new_reactor_power, dtype=float)
+    new_reactor_lifetime = np.asarray(new_reactor_lifetime, dtype=int)
+    deploy_array = np.zeros((n_scenarios, total_steps))
+    n_running = np.zeros((n_scenarios, total_steps))
+    # retiring[s, i]: number of reactors of scenario s that retire at step i
+    retiring = np.zeros((n_scenarios, total_steps + 1))
+    running = np.zeros(n_scenarios)
+    # skip index 0
+    for indx in range(1, total_steps):
+        running -= retiring[:, indx]
+        lack = total_lack[:, indx] - running * new_reactor_power
+        deploy = np.flatnonzero(available[:, indx]
+                                & (lack > new_reactor_power))
+        if len(deploy):
+            num = lack[deploy] // new_reactor_power[deploy]
+            deploy_array[deploy, indx] = num
+            lifetime = new_reactor_lifetime[deploy]
+            live = lifetime > 0
+            deploy, num, lifetime = deploy[live], num[live], lifetime[live]
+            running[deploy] += num
+            retiring[deploy, np.minimum(indx + lifetime, total_steps)] += num
+        n_running[:, indx] = running
+    return deploy_array, n_running * new_reactor_power[:, np.newaxis]
+
+
+def plan_deployment(power_dict, inst_list, demand_eq, technologies,
+                    **params):
+    """ Calculates the deployment of several reactor technologies that
+        together maintain the power demand, e.g. legacy LWRs handing
+        off to a new design.
+
+    Parameters:
+    -----------
+    power_dict: dictionary
+        key: institution
+        value: capacity timeseries
+    inst_list: list
+        list of institution names to take into account
+    demand_eq: str
+        demand equation w.r.t time(t) and params, see compile_demand
+    technologies: list of dict
+        reactor technologies, see technology_sweep
+    params: float
+        values of the other names of the demand equation
+
+    Returns:
+    --------
+    deploy_dict: dictionary
+        key: technology name
+        value: timeseries for deploying the technology
+    deployed_power: array
+        timeseries of the combined power of the deployed reactors
+    """
+    total_steps = len(power_dict[inst_list[0]])
+    total_power = existing_power(power_dict, inst_list, total_steps)
+    total_lack = get_demand(demand_eq, total_steps, **params) - total_power
+    return technology_sweep(total_lack, technologies)
+
+
+def technology_sweep(total_lack, technologies):
+    """ deployment_sweep for several technologies, in one pass over
+        time at O(technologies) per timestep.
+
+        At every timestep, the technologies that are available fill the
+        remaining lack in order of priority. Technologies with the same
+        priority split the lack by their share. Each one deploys
+        part // power reactors if its part of the lack is larger than
+        its power, as in deployment_sweep.
+
+    Parameters:
+    -----------
+    total_lack: array
+        power demand minus existing capacity timeseries
+    technologies: list of dict
+        reactor technologies, with keys
+        'name': str, unique name of the technology
+        'power': float, reactor power capacity [GWe]
+        'lifetime': int, reactor lifetime
+        'avail': (first, last) timesteps the technology can be deployed
+            in, last excluded, either can be None (default: always)
+        'priority': int, lower is filled first (default: 0)
+        'share': float, share of the lack among technologies of the
+            same priority (default: 1)
+
+    Returns:
+    --------
+    deploy_dict: dictionary
+        key: technology name
+        value: timeseries for deploying the technology
+    deployed_power: array
+        timeseries of the combined power of the deployed reactors
+    """
+    names = [tech['name'] for tech in technologies]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError('technology names must be unique: %s'
+                         % ', '.join(duplicates))
+    total_steps = len(total_lack)
+    n_tech = len(technologies)
+    power = np.array([tech['power'] for tech in technologies], dtype=float)
+    lifetime = [int(tech['lifetime']) for tech in technologies]
+    share = [float(tech.get('share', 1)) for tech in technologies]
+    windows = []
+    for tech in technologies:
+        first, last = tech.get('avail', (None, None))
+        windows.append((0 if first is None else first,
+                        total_steps if last is None else last))
+    priorities = sorted(set(tech.get('priority', 0) for tech in technologies))
+    groups = [[indx for indx, tech in enumerate(technologies)
+               if tech.get('priority', 0) == priority]
+              for priority in priorities]
+
+    deploy_array = np.zeros((n_tech, total_steps))
+    n_running = np.zeros((n_tech, total_steps))
+    # retiring[k, i]: number of reactors of technology k that retire at i
+    retiring = np.zeros((n_tech, total_steps + 1))
+    running = np.zeros(n_tech)
+    # skip index 0
+    for indx in range(1, total_steps):
+        running -= retiring[:, indx]
+        lack = total_lack[indx] - np.sum(running * power)
+        for group in groups:
+            available = [tech for tech in group
+                         if windows[tech][0] <= indx < windows[tech][1]]
+            if not available:
+                continue
+            total_share = sum(share[tech] for tech in available)
+            deployed = 0.0
+            for tech in available:
+                part = lack * share[tech] / total_share
+                if part > power[tech]:
+                    num = part // power[tech]
+                    deploy_array[tech, indx] = num
+                    deployed += num * power[tech]
+                    if lifetime[tech] > 0:
+                        running[tech] += num
+                        retiring[tech, min(indx + lifetime[tech],
+                                           total_steps)] += num
+            lack -= deployed
+        n_running[:, indx] = running
+
+    deploy_dict = {tech['name']: deploy_array[indx]
+                   for indx, tech in enumerate(technologies)}
+    return deploy_dict, (n_running * power[:, np.newaxis]).sum(axis=0)
 
 
 def write_deployinst(deploy_array, reactor_name,
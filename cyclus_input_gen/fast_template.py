@@ -0,0 +1,92 @@
+"""
+This file contains FastTemplate, a renderer for templates that only
+substitute plain variables, and specialize, which builds one from a
+template source when possible.
+"""
+import re
+
+# a plain variable substitution, e.g. {{ reactor_name }}
+slot_re = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+# any other jinja syntax
+syntax_re = re.compile(r'\{\{|\{%|\{#|\}\}')
+# names jinja parses as constants rather than variables
+jinja_constants = ('true', 'false', 'none', 'True', 'False', 'None')
+# line breaks jinja normalizes
+newline_re = re.compile(r'(\r\n|\r|\n)')
+
+
+class FastTemplate(object):
+    """ Template split into static segments and variable slots, which
+        renders with a plain string join.
+
+        The output is identical to the jinja template of the same source
+        for templates that specialize() accepts.
+    """
+
+    def __init__(self, segments, slots):
+        """
+        Parameters
+        ----------
+        segments: list of str
+            static text, one more segment than there are slots
+        slots: list of str
+            variable names, slot i goes between segments i and i + 1
+        """
+        self.segments = segments
+        self.slots = slots
+
+    def render(self, **context):
+        """ Renders the template with the given variables. Missing
+            variables render as empty strings, as in jinja.
+        """
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            if slot in context:
+                parts.append(str(context[slot]))
+            parts.append(segment)
+        return ''.join(parts)
+
+
+def specialize(source, environment):
+    """ Builds a FastTemplate for a template source, if it only uses
+        plain variable substitutions.
+
+    Parameters
+    ----------
+    source: str
+        template source
+    environment: jinja2.Environment
+        environment the source would otherwise be compiled with; its
+        newline handling is reproduced
+
+    Returns
+    -------
+    template: FastTemplate
+        fast renderer, or None if the source (or the environment) needs
+        the general jinja machinery
+    """
+    default_syntax = (environment.variable_start_string == '{{'
+                      and environment.variable_end_string == '}}'
+                      and environment.block_start_string == '{%'
+                      and environment.comment_start_string == '{#'
+                      and environment.line_statement_prefix is None
+                      and environment.line_comment_prefix is None)
+    if (not default_syntax or environment.finalize is not None
+            or environment.autoescape is not False):
+        return None
+
+    # same newline handling as the jinja lexer
+    lines = newline_re.split(source)[::2]
+    if not environment.keep_trailing_newline and lines[-1] == '':
+        del lines[-1]
+    source = environment.newline_sequence.join(lines)
+
+    segments = slot_re.split(source)
+    statics = segments[::2]
+    slots = segments[1::2]
+    if any(syntax_re.search(static) for static in statics):
+        return None
+    if any(slot in environment.globals or slot in jinja_constants
+           for slot in slots):
+        return None
+    return FastTemplate(statics, slots)
@@ -0,0 +1,340 @@
+"""
+This file contains the Fleet class, a compact columnar table of
+reactor data, the Reactor class, a lightweight view of one row, and
+the FleetIndex and Query classes, which answer repeated selections
+from sorted column indexes.
+"""
+import sys
+import numpy as np
+
+# text columns stored as integer codes into the shared string dictionary
+CATEGORICAL_FIELDS = ('country', 'type', 'status', 'operator')
+
+# date columns, integer dates (YYYYMMDD) with -1 for unknown dates
+DATE_FIELDS = ('const_date', 'first_crit', 'first_grid',
+               'commercial', 'shutdown_date')
+
+# integer columns that fit in 32 bits (dates are YYYYMMDD)
+INT32_FIELDS = ('net_elec_capacity', 'const_date', 'cons_year',
+                'first_crit', 'first_grid', 'commercial',
+                'shutdown_date', 'entry_time', 'lifetime')
+
+
+def decode_column(column):
+    """ Decodes a column of byte strings, decoding every distinct
+        value only once.
+
+    Parameters
+    ----------
+    column: array
+        array of byte strings
+
+    Returns
+    -------
+    decoded: array
+        object array of str
+    """
+    column = np.asarray(column)
+    if column.dtype.kind != 'S':
+        return column.astype(object)
+    unique_values, inverse = np.unique(column, return_inverse=True)
+    decoded = np.array([value.decode('utf-8') for value in unique_values],
+                       dtype=object)
+    return decoded[inverse.reshape(column.shape)]
+
+
+class Fleet(object):
+    """ Compact columnar table of reactor data.
+
+        The country, type, status and operator columns are stored as
+        int32 codes into one shared dictionary of strings, reactor names
+        are decoded once, and dates are int32 in YYYYMMDD format. Indexing
+        with a column name returns the column (with text columns as str),
+        indexing with an integer returns a Reactor view, and indexing with
+        a mask, slice or index array returns a Fleet with the selected
+        rows that shares the string dictionary.
+    """
+
+    def __init__(self, columns, strings, fields):
+        """
+        Parameters
+        ----------
+        columns: dict
+            key: field name
+            value: column array (codes for the CATEGORICAL_FIELDS)
+        strings: array
+            object array of str, the shared dictionary of the codes
+        fields: tuple of str
+            field names, in order
+        """
+        self.columns = columns
+        self.strings = strings
+        self.fields = tuple(fields)
+
+    @classmethod
+    def from_array(cls, reactor_array):
+        """ Builds a Fleet from a structured reactor array,
+            e.g. from from_pris.read_csv.
+        """
+        fields = reactor_array.dtype.names
+        categorical = [field for field in CATEGORICAL_FIELDS
+                       if field in fields]
+        strings = np.unique(np.concatenate(
+            [np.unique(reactor_array[field]) for field in categorical]
+            + [np.array([], dtype='S1')]))
+        columns = {}
+        for field in fields:
+            column = reactor_array[field]
+            if field in categorical:
+                columns[field] = np.searchsorted(
+                    strings, column).astype(np.int32)
+            elif column.dtype.kind == 'S':
+                columns[field] = decode_column(column)
+            elif field in INT32_FIELDS:
+                columns[field] = column.astype(np.int32)
+            else:
+                columns[field] = np.array(column)
+        return cls(columns, decode_column(strings), fields)
+
+    def to_array(self):
+        """ Converts the Fleet back to a structured array, with the
+            text columns as byte strings.
+        """
+        dtype = []
+        for field in self.fields:
+            column = self.columns[field]
+            if field in CATEGORICAL_FIELDS or column.dtype == object:
+                dtype.append((field, 'S128'))
+            else:
+                dtype.append((field, column.dtype))
+        reactor_array = np.empty(len(self), dtype=dtype)
+        for field in self.fields:
+            column = self[field]
+            if column.dtype == object:
+                column = [value.encode('utf-8') for value in column]
+            reactor_array[field] = column
+        return reactor_array
+
+    def codes(self, field):
+        """ Returns the integer codes of a categorical column."""
+        return self.columns[field]
+
+    def take(self, rows):
+        """ Returns a Fleet with the selected rows (mask, slice or
+            index array), sharing the string dictionary.
+        """
+        columns = {field: column[rows]
+                   for field, column in self.columns.items()}
+        return Fleet(columns, self.strings, self.fields)
+
+    @property
+    def nbytes(self):
+        """ Approximate memory used by the table in bytes."""
+        nbytes = self.strings.nbytes
+        for column in self.columns.values():
+            nbytes += column.nbytes
+            if column.dtype == object:
+                nbytes += sum(sys.getsizeof(value) for value in column)
+        return nbytes
+
+    def __len__(self):
+        return len(self.columns[self.fields[0]])
+
+    def __iter__(self):
+        for indx in range(len(self)):
+            yield Reactor(self, indx)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key in CATEGORICAL_FIELDS:
+                return self.strings[self.columns[key]]
+            return self.columns[key]
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('reactor index out of range')
+            return Reactor(self, int(key))
+        return self.take(key)
+
+    def __setitem__(self, field, values):
+        if field in CATEGORICAL_FIELDS:
+            raise KeyError('categorical column %s is read-only' % field)
+        self.columns[field][...] = values
+
+
+class Reactor(object):
+    """ View of one reactor (row) of a Fleet. Fields are read with
+        reactor['field'] or reactor.field.
+    """
+    __slots__ = ('fleet', 'index')
+
+    def __init__(self, fleet, index):
+        self.fleet = fleet
+        self.index = index
+
+    def __getitem__(self, field):
+        column = self.fleet.columns[field]
+        if field in CATEGORICAL_FIELDS:
+            return self.fleet.strings[column[self.index]]
+        return column[self.index]
+
+    def __setitem__(self, field, value):
+        if field in CATEGORICAL_FIELDS:
+            raise KeyError('categorical column %s is read-only' % field)
+        self.fleet.columns[field][self.index] = value
+
+    def __getattr__(self, field):
+        try:
+            return self[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def __repr__(self):
+        return 'Reactor(%s)' % ', '.join(
+            '%s=%r' % (field, self[field]) for field in self.fleet.fields)
+
+
+class FleetIndex(object):
+    """ Sorted indexes over the columns of a Fleet, to answer repeated
+        queries without re-scanning the table.
+
+        The index of a column is built the first time a query uses it:
+        a stable argsort of the column and the sorted column itself, so
+        every condition is resolved with two binary searches.
+    """
+
+    def __init__(self, fleet):
+        """
+        Parameters
+        ----------
+        fleet: Fleet
+            fleet to index. A structured reactor array is converted
+            with Fleet.from_array.
+        """
+        if not isinstance(fleet, Fleet):
+            fleet = Fleet.from_array(fleet)
+        self.fleet = fleet
+        self.indexes = {}
+
+    def sorted_index(self, field):
+        """ Returns (order, values), the row order that sorts a column
+            and the sorted column, building them on first use.
+        """
+        if field not in self.indexes:
+            column = self.fleet.columns[field]
+            order = np.argsort(column, kind='stable')
+            self.indexes[field] = (order, column[order])
+        return self.indexes[field]
+
+    def query(self):
+        """ Returns a Query that selects every reactor of the fleet."""
+        return Query(self)
+
+    def equal_rows(self, field, values):
+        """ Returns the rows where the column is one of the values.
+            Text columns are matched by str.
+        """
+        if isinstance(values, (str, bytes)) or np.isscalar(values):
+            values = [values]
+        if field in CATEGORICAL_FIELDS:
+            codes = []
+            for value in values:
+                if isinstance(value, bytes):
+                    value = value.decode('utf-8')
+                code = np.searchsorted(self.fleet.strings, value)
+                if (code < len(self.fleet.strings)
+                        and self.fleet.strings[code] == value):
+                    codes.append(code)
+            values = codes
+        order, sorted_values = self.sorted_index(field)
+        rows = [order[np.searchsorted(sorted_values, value, 'left'):
+                      np.searchsorted(sorted_values, value, 'right')]
+                for value in set(values)]
+        return np.concatenate([np.array([], dtype=np.intp)] + rows)
+
+    def range_rows(self, field, low=None, high=None):
+        """ Returns the rows where low <= column <= high. Either bound
+            can be None. Unknown dates (-1) and nan values never match.
+        """
+        order, sorted_values = self.sorted_index(field)
+        if field in DATE_FIELDS and (low is None or low < 0):
+            low = 0
+        if low is None:
+            start = 0
+        else:
+            start = np.searchsorted(sorted_values, low, 'left')
+        if high is None:
+            # nan sorts last
+            end = len(sorted_values)
+            if sorted_values.dtype.kind == 'f':
+                end -= np.count_nonzero(np.isnan(sorted_values))
+        else:
+            end = np.searchsorted(sorted_values, high, 'right')
+        return order[start:end]
+
+
+class Query(object):
+    """ Composable selection of reactors from a FleetIndex.
+
+        Every method returns a new Query with one more condition, and
+        the conditions are combined with a logical and, e.g.
+
+        index.query().where('type', 'PWR').where('status', 'Operational')
+             .between('net_elec_capacity', 900)
+             .between('first_crit', high=19891231)
+    """
+
+    def __init__(self, index, conditions=()):
+        """
+        Parameters
+        ----------
+        index: FleetIndex
+            index the query runs against
+        conditions: tuple
+            (method, args) pairs of FleetIndex row lookups
+        """
+        self.index = index
+        self.conditions = conditions
+
+    def _with(self, method, *args):
+        return Query(self.index, self.conditions + ((method, args),))
+
+    def where(self, field, values):
+        """ Keeps the reactors whose field is one of the values
+            (a single value or a list), e.g. where('type', ['PWR', 'BWR']).
+        """
+        return self._with('equal_rows', field, values)
+
+    def between(self, field, low=None, high=None):
+        """ Keeps the reactors with low <= field <= high, bounds
+            included. Either bound can be None.
+        """
+        return self._with('range_rows', field, low, high)
+
+    def within(self, lat=(None, None), long=(None, None)):
+        """ Keeps the reactors inside a latitude / longitude bounding box,
+            given as (low, high) pairs.
+        """
+        return self.between('lat', *lat).between('long', *long)
+
+    def rows(self):
+        """ Returns the sorted row numbers of the selected reactors."""
+        if not self.conditions:
+            return np.arange(len(self.index.fleet))
+        row_sets = [getattr(self.index, method)(*args)
+                    for method, args in self.conditions]
+        row_sets.sort(key=len)
+        rows = np.sort(row_sets[0])
+        for other in row_sets[1:]:
+            if not len(rows):
+                break
+            rows = rows[np.isin(rows, other, assume_unique=True)]
+        return rows
+
+    def fleet(self):
+        """ Returns the selected reactors as a Fleet."""
+        return self.index.fleet.take(self.rows())
+
+    def __len__(self):
+        return len(self.rows())
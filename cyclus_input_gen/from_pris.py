@@ -2,8 +2,42 @@ import sys
 import jinja2
 import numpy as np
 import os
+import csv
+import functools
+import hashlib
+import json
+import multiprocessing
+import time
 from datetime import datetime
 from cyclus_input_gen.templates import template_collections
+from cyclus_input_gen.fleet import Fleet, decode_column, DATE_FIELDS
+from cyclus_input_gen.fast_template import specialize
+
+# columns of the PRIS csv file, in order, with their parsed types
+CSV_FIELDS = ('country', 'reactor_name', 'type', 'net_elec_capacity',
+              'status', 'operator', 'const_date', 'cons_year', 'first_crit',
+              'first_grid', 'commercial', 'shutdown_date', 'ucf',
+              'lat', 'long', 'entry_time', 'lifetime')
+# with explicit widths and byte order, so that stores written by
+# convert_csv open on any platform
+CSV_TYPES = ('S128', 'S128', 'S128', '<i8', 'S128', 'S128', 'S128',
+             '<i8', 'S128', 'S128', 'S128', 'S128', '<f8',
+             '<f8', '<f8', '<i8', '<i8')
+
+# type of the date columns once converted to integers (YYYYMMDD)
+DATE_TYPE = '<i8'
+
+# dtype of the parsed database, with integer dates
+DATABASE_DTYPE = np.dtype([(field, DATE_TYPE if field in DATE_FIELDS
+                            else kind)
+                           for field, kind in zip(CSV_FIELDS, CSV_TYPES)])
+
+# version of the csv parser, stored in the database cache key.
+# bump it whenever parse_csv or normalize_dates changes its output.
+PARSER_VERSION = 3
+
+# version of the layout of the incremental manifest, see country_fragments
+MANIFEST_VERSION = 1
 
 # tells command format if input is invalid
 
@@ -25,60 +59,459 @@ def delete_file(file):
     null
 
     """
-    if os.path.exists('./' + file) is True:
-        os.system('rm ' + file)
+    if os.path.exists(file) is True:
+        os.remove(file)
 
 
-def read_csv(csv_file, country_list):
+def create_temp_file(directory, prefix=''):
+    """Creates a new, uniquely named temporary file for an atomic write.
+
+       Unlike tempfile.mkstemp, the file is created with the default
+       permissions of the process (0666 minus the current umask), so it
+       keeps them once it is moved in place with os.replace.
+
+    Parameters
+    ----------
+    directory: str
+        directory of the file, on the same file system as its final name
+    prefix: str
+        start of the file name
+
+    Returns
+    -------
+    fd: int
+        file descriptor opened for writing
+    tmp_file: str
+        name of the file
+    """
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_file = os.path.join(directory, '%s%s.tmp' % (
+            prefix, os.urandom(8).hex()))
+        try:
+            return os.open(tmp_file, flags, 0o666), tmp_file
+        except FileExistsError:
+            continue
+
+
+def read_csv(csv_file, country_list, cache_dir=None):
     """This function reads the csv file and returns the list.
 
     Parameters
     ---------
     csv_file: str
-        csv file that lists country, reactor name, net_elec_capacity etc.
+        csv file that lists country, reactor name, net_elec_capacity etc.,
+        or a .npy database store written by convert_csv
+    country_list: list of str
+        list of countries to extract
+    cache_dir: str
+        directory of the parsed database cache. The csv file is parsed
+        from scratch if None.
 
     Returns
     -------
     reactor_array:  list
         array with the data from csv file
     """
-    reactor_array = np.genfromtxt(csv_file,
-                                  skip_header=2,
-                                  delimiter=',',
-                                  dtype=('S128', 'S128',
-                                         'S128', 'int',
-                                         'S128', 'S128', 'S128',
-                                         'int', 'S128',                                         
-                                         'S128', 'S128',
-                                         'S128', 'float',
-                                         'float', 'float',
-                                         'int', 'int'),
-                                  names=('country', 'reactor_name',
-                                         'type', 'net_elec_capacity',
-                                         'status', 'operator', 'const_date',
-                                         'cons_year', 'first_crit',
-                                         'first_grid', 'commercial',
-                                         'shutdown_date', 'ucf',
-                                         'lat', 'long',
-                                         'entry_time', 'lifetime'))
-    indx_list = []
-    for indx, reactor in enumerate(reactor_array):
-        if reactor['country'].decode('utf-8') not in country_list:
-            indx_list.append(indx)
-    reactor_array = np.delete(reactor_array, indx_list, axis=0)
-
-    for indx, reactor in enumerate(reactor_array):
-        reactor_array[indx]['const_date'] = std_date_format(
-            reactor['const_date'])
-        reactor_array[indx]['first_crit'] = std_date_format(reactor['first_crit'])
-        reactor_array[indx]['first_grid'] = std_date_format(
-            reactor['first_grid'])
-        reactor_array[indx]['commercial'] = std_date_format(
-            reactor['commercial'])
-        reactor_array[indx]['shutdown_date'] = std_date_format(
-            reactor['shutdown_date'])
-        
-    return filter_test_reactors(reactor_array)
+    if csv_file.endswith('.npy'):
+        return filter_reactors(open_database(csv_file), country_list)
+    if cache_dir is not None:
+        return filter_reactors(load_database(csv_file, cache_dir),
+                               country_list)
+    reactor_array = filter_reactors(parse_csv(csv_file), country_list)
+
+    return normalize_dates(reactor_array)
+
+
+def read_fleet(csv_file, country_list, cache_dir=None):
+    """This function reads the csv file into a compact Fleet table.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.,
+        or a .npy database store written by convert_csv
+    country_list: list of str
+        list of countries to extract
+    cache_dir: str
+        directory of the parsed database cache. The csv file is parsed
+        from scratch if None.
+
+    Returns
+    -------
+    fleet: Fleet
+        compact table with the data from csv file
+    """
+    return Fleet.from_array(read_csv(csv_file, country_list, cache_dir))
+
+
+def parse_csv(csv_file):
+    """This function parses the csv file into a structured array,
+       without any filtering or date conversion. Whitespace around the
+       fields is stripped.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.
+
+    Returns
+    -------
+    reactor_array: array
+        array with the raw data from csv file
+    """
+    return np.genfromtxt(csv_file,
+                         skip_header=2,
+                         delimiter=',',
+                         autostrip=True,
+                         dtype=CSV_TYPES,
+                         names=CSV_FIELDS)
+
+
+def read_csv_filtered(csv_file, country_list=None, reactor_types=None,
+                      statuses=None, min_capacity=100, date_windows=None):
+    """This function parses the csv file line by line and only converts
+       the rows that pass the filters, so the rejected reactors are
+       never materialized. The result is the same as filtering the
+       output of read_csv.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.
+    country_list, reactor_types, statuses, min_capacity, date_windows:
+        filters, see reactor_mask
+
+    Returns
+    -------
+    reactor_array: array
+        array with the reactors that pass the filters, with integer dates
+    """
+    def encoded(values):
+        if values is None:
+            return None
+        return set(value.encode('utf-8') if isinstance(value, str)
+                   else value for value in values)
+
+    text_filters = [(CSV_FIELDS.index(field), encoded(values))
+                    for field, values in (('country', country_list),
+                                          ('type', reactor_types),
+                                          ('status', statuses))
+                    if values is not None]
+    windows = [(CSV_FIELDS.index(field), first, last)
+               for field, (first, last) in (date_windows or {}).items()]
+    capacity_column = CSV_FIELDS.index('net_elec_capacity')
+    date_format = functools.lru_cache(maxsize=None)(std_date_format)
+    convert = _row_converter(date_format)
+
+    rows = []
+    for fields in _csv_records(csv_file):
+        if any(fields[column] not in values
+               for column, values in text_filters):
+            continue
+        if (min_capacity is not None
+                and _parse_int(fields[capacity_column]) < min_capacity):
+            continue
+        rejected = False
+        for column, first, last in windows:
+            date = date_format(fields[column])
+            if (date == -1 or (first is not None and date < first)
+                    or (last is not None and date > last)):
+                rejected = True
+                break
+        if rejected:
+            continue
+        rows.append(convert(fields))
+
+    return np.array(rows, dtype=DATABASE_DTYPE)
+
+
+def _csv_records(csv_file):
+    """ Yields the raw (bytes) fields of every data row of the csv file,
+        with surrounding whitespace stripped, skipping the header,
+        comments and blank lines like parse_csv.
+    """
+    with open(csv_file, 'rb') as src:
+        for _ in range(2):
+            src.readline()
+        for line in src:
+            line = line.split(b'#', 1)[0].strip()
+            if line:
+                yield [field.strip() for field in line.split(b',')]
+
+
+def _row_converter(date_format=None):
+    """ Returns a function that converts the raw fields of a csv row
+        into a tuple of DATABASE_DTYPE, with date_format (default
+        std_date_format) for the dates.
+    """
+    date_format = date_format or std_date_format
+    converters = []
+    for field, kind in zip(CSV_FIELDS, CSV_TYPES):
+        if field in DATE_FIELDS:
+            converters.append(date_format)
+        elif kind == '<i8':
+            converters.append(_parse_int)
+        elif kind == '<f8':
+            converters.append(_parse_float)
+        else:
+            converters.append(bytes)
+
+    def convert(fields):
+        return tuple(convert_field(field) for convert_field, field
+                     in zip(converters, fields))
+    return convert
+
+
+def _parse_int(field):
+    """ Converts a csv field to int like np.genfromtxt, -1 if empty."""
+    if not field:
+        return -1
+    try:
+        return int(field)
+    except ValueError:
+        return int(float(field))
+
+
+def _parse_float(field):
+    """ Converts a csv field to float like np.genfromtxt, nan if empty."""
+    if not field:
+        return np.nan
+    return float(field)
+
+
+def database_key(csv_file):
+    """This function computes the cache key of a csv file from its
+       content and the parser version.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.
+
+    Returns
+    -------
+    key: str
+        hex digest identifying the parsed database
+    """
+    digest = hashlib.sha256(('v%i' % PARSER_VERSION).encode('utf-8'))
+    with open(csv_file, 'rb') as src:
+        for block in iter(lambda: src.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_database(csv_file, cache_dir):
+    """This function returns the parsed and date-normalized database
+       of a csv file, using an on-disk cache.
+
+       The cache entry is named after the csv file and keyed by its
+       content hash and PARSER_VERSION, so a modified csv file or a new
+       parser is reparsed automatically and replaces the stale entry.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.
+    cache_dir: str
+        directory where the parsed databases are stored
+
+    Returns
+    -------
+    reactor_array: array
+        read-only memory-mapped array with the data from csv file
+    """
+    # entries are named after the csv file and its location, so that
+    # different csv files with the same name do not evict each other
+    location = hashlib.sha256(os.path.abspath(csv_file).encode('utf-8'))
+    prefix = '%s-%s-' % (os.path.basename(csv_file),
+                         location.hexdigest()[:8])
+    cache_file = os.path.join(cache_dir,
+                              prefix + database_key(csv_file) + '.npy')
+    if not os.path.exists(cache_file):
+        os.makedirs(cache_dir, exist_ok=True)
+        reactor_array = normalize_dates(parse_csv(csv_file))
+        # write to a temporary file first so that concurrent runs never
+        # see a partially written cache entry
+        fd, tmp_file = create_temp_file(cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                np.save(tmp, reactor_array)
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            delete_file(tmp_file)
+            raise
+        for entry in os.listdir(cache_dir):
+            stale = os.path.join(cache_dir, entry)
+            if (entry.startswith(prefix) and entry.endswith('.npy')
+                    and stale != cache_file):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    # already removed by a concurrent run
+                    pass
+
+    return np.load(cache_file, mmap_mode='r')
+
+
+def read_blocks(csv_file, country_list, block_size=10000):
+    """This function reads the csv file (or a database store, see
+       convert_csv) in blocks of rows, so that only one block is in
+       memory at a time.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.,
+        or a .npy database store written by convert_csv
+    country_list: list of str
+        list of countries to extract
+    block_size: int
+        number of csv rows read at a time
+
+    Yields
+    ------
+    reactor_array: array
+        filtered and date-normalized reactors of a block, in file order
+    """
+    if csv_file.endswith('.npy'):
+        store = open_database(csv_file)
+        for start in range(0, len(store), block_size):
+            yield filter_reactors(np.asarray(store[start:start + block_size]),
+                                  country_list)
+        return
+    convert = _row_converter(functools.lru_cache(maxsize=None)(
+        std_date_format))
+    block = []
+    for fields in _csv_records(csv_file):
+        block.append(convert(fields))
+        if len(block) == block_size:
+            yield filter_reactors(np.array(block, dtype=DATABASE_DTYPE),
+                                  country_list)
+            block = []
+    if block:
+        yield filter_reactors(np.array(block, dtype=DATABASE_DTYPE),
+                              country_list)
+
+
+def convert_csv(csv_file, store_file, block_size=100000):
+    """This function converts a PRIS-format csv file into a binary
+       database store: a structured .npy file with DATABASE_DTYPE that
+       open_database maps into memory. The csv file is converted in
+       blocks of rows, so files larger than memory can be converted.
+
+    Parameters
+    ---------
+    csv_file: str
+        csv file that lists country, reactor name, net_elec_capacity etc.
+    store_file: str
+        .npy file to write
+    block_size: int
+        number of rows converted at a time
+
+    Returns
+    -------
+    n_reactors: int
+        number of reactors in the store
+    """
+    n_reactors = sum(1 for _ in _csv_records(csv_file))
+    convert = _row_converter(functools.lru_cache(maxsize=None)(
+        std_date_format))
+    # write to a temporary file first so that readers never see a
+    # partially written store
+    fd, tmp_file = create_temp_file(
+        os.path.dirname(os.path.abspath(store_file)))
+    os.close(fd)
+    try:
+        store = np.lib.format.open_memmap(tmp_file, mode='w+',
+                                          dtype=DATABASE_DTYPE,
+                                          shape=(n_reactors,))
+        start = 0
+        block = []
+        for fields in _csv_records(csv_file):
+            block.append(convert(fields))
+            if len(block) == block_size:
+                store[start:start + len(block)] = block
+                start += len(block)
+                block = []
+        store[start:start + len(block)] = block
+        store.flush()
+        del store
+        os.replace(tmp_file, store_file)
+    except BaseException:
+        delete_file(tmp_file)
+        raise
+    return n_reactors
+
+
+def open_database(store_file):
+    """This function opens a database store written by convert_csv
+       (or a load_database cache entry) without reading it into memory.
+
+    Parameters
+    ---------
+    store_file: str
+        .npy database store
+
+    Returns
+    -------
+    reactor_array: array
+        read-only memory-mapped array with the reactor data
+    """
+    reactor_array = np.load(store_file, mmap_mode='r')
+    if reactor_array.dtype != DATABASE_DTYPE:
+        raise ValueError('%s is not a reactor database store' % store_file)
+    return reactor_array
+
+
+def normalize_dates(reactor_array):
+    """This function converts the date columns of the reactor array
+       from date strings to integer dates with format YYYYMMDD.
+
+    Parameters
+    ---------
+    reactor_array: array
+        array with reactor data, with the date columns as strings.
+
+    Returns
+    -------
+    array
+        copy of the array where the columns in DATE_FIELDS are integers
+    """
+    names = reactor_array.dtype.names
+    dtype = [(name, DATE_TYPE if name in DATE_FIELDS
+              else reactor_array.dtype[name]) for name in names]
+    normalized = np.empty(reactor_array.shape, dtype=dtype)
+    for name in names:
+        if name in DATE_FIELDS:
+            normalized[name] = std_date_array(reactor_array[name])
+        else:
+            normalized[name] = reactor_array[name]
+    return normalized
+
+
+def std_date_array(date_column):
+    """ This function converts a whole column of date strings
+        to integer dates with format YYYYMMDD
+
+        Every distinct date string is converted only once with
+        `std_date_format`, and the results are mapped back onto
+        the column.
+
+    Parameters:
+    -----------
+    date_column: array
+        array of date strings
+
+    Returns:
+    --------
+    dates: array
+        integer dates with format YYYYMMDD, -1 where unknown
+    """
+    unique_dates, inverse = np.unique(date_column, return_inverse=True)
+    memo = np.array([std_date_format(date) for date in unique_dates],
+                    dtype=int)
+    return memo[inverse.reshape(np.shape(date_column))]
 
 
 
@@ -94,9 +527,10 @@ def std_date_format(date_string):
     Returns:
     --------
     date: int
-        integer date with format YYYYMMDD
+        integer date with format YYYYMMDD, -1 if empty or unknown
     """
-    date_string = date_string.decode('utf-8')
+    if isinstance(date_string, bytes):
+        date_string = date_string.decode('utf-8')
 
     if date_string.count('/') == 2:
         obj = datetime.strptime(date_string, '%m/%d/%Y')
@@ -104,9 +538,11 @@ def std_date_format(date_string):
     if len(date_string) == 4:
         # default first of the year if only year is given
         return int(date_string + '0101')
-    if date_string == '':
-        return int(-1)
-        
+    if len(date_string) == 8 and date_string.isdigit():
+        # already in YYYYMMDD format
+        return int(date_string)
+    return int(-1)
+
 
 def filter_test_reactors(reactor_array):
     """This function filters experimental reactors that have a
@@ -122,13 +558,101 @@ def filter_test_reactors(reactor_array):
     array
         array with the filtered data
     """
-    hitlist = []
-    count = 0
-    for data in reactor_array:
-        if data['net_elec_capacity'] < 100:
-            hitlist.append(count)
-        count += 1
-    return np.delete(reactor_array, hitlist)
+    return filter_reactors(reactor_array)
+
+
+def reactor_mask(reactor_array, country_list=None, min_capacity=100,
+                 reactor_types=None, statuses=None, date_windows=None):
+    """This function evaluates the reactor filters over the whole array
+       at once and returns the selection as a boolean mask.
+
+    Parameters
+    ---------
+    reactor_array: array
+        array with reactor data.
+    country_list: list of str
+        countries to keep. All countries are kept if None.
+    min_capacity: int
+        reactors with a net electricity capacity below this value [MWe]
+        are removed. No capacity cut is made if None.
+    reactor_types: list of str
+        reactor types to keep, e.g. ['PWR', 'BWR']. All types are kept
+        if None.
+    statuses: list of str
+        statuses to keep, e.g. ['Operational']. All statuses are kept
+        if None.
+    date_windows: dict
+        key: date column, e.g. 'first_crit'
+        value: (first, last) yyyymmdd dates, inclusive. Either bound can
+        be None. Reactors with an unknown (-1) date are removed.
+        Needs integer date columns (see normalize_dates).
+
+    Returns
+    -------
+    mask: array
+        boolean array, True for the reactors that pass every filter
+    """
+    mask = np.ones(len(reactor_array), dtype=bool)
+    for field, values in (('country', country_list),
+                          ('type', reactor_types),
+                          ('status', statuses)):
+        if values is not None:
+            mask &= _isin_text(reactor_array[field], values)
+    if min_capacity is not None:
+        mask &= reactor_array['net_elec_capacity'] >= min_capacity
+    for field, (first, last) in (date_windows or {}).items():
+        column = reactor_array[field]
+        mask &= column != -1
+        if first is not None:
+            mask &= column >= first
+        if last is not None:
+            mask &= column <= last
+    return mask
+
+
+def _isin_text(column, values):
+    """ Boolean mask of the entries of a text column (bytes or str)
+        that are in values.
+    """
+    if column.dtype.kind == 'S':
+        values = [value.encode('utf-8') if isinstance(value, str) else value
+                  for value in set(values)]
+    else:
+        values = list(set(values))
+    return np.isin(column, np.array(values, dtype=column.dtype))
+
+
+def filter_reactors(reactor_array, country_list=None, min_capacity=100,
+                    reactor_types=None, statuses=None, date_windows=None,
+                    block_size=100000):
+    """This function filters the reactor array by country, net
+       electricity capacity, type, status and dates in a single pass.
+
+    Parameters
+    ---------
+    reactor_array: array
+        array with reactor data.
+    country_list, min_capacity, reactor_types, statuses, date_windows:
+        filters, see reactor_mask
+    block_size: int
+        number of rows filtered at a time for memory-mapped arrays,
+        so that only the selected reactors are read into memory
+
+    Returns
+    -------
+    array
+        compacted copy of the array with the reactors that pass the filters
+    """
+    filters = (country_list, min_capacity, reactor_types, statuses,
+               date_windows)
+    if not isinstance(reactor_array, np.memmap):
+        return reactor_array[reactor_mask(reactor_array, *filters)]
+    rows = [start + np.flatnonzero(
+                reactor_mask(reactor_array[start:start + block_size],
+                             *filters))
+            for start in range(0, len(reactor_array), block_size)]
+    rows = np.concatenate([np.array([], dtype=np.intp)] + rows)
+    return np.asarray(reactor_array[rows])
 
 
 def get_ymd(yyyymmdd):
@@ -224,9 +748,205 @@ def get_entrytime(init_date, start_date):
     return entry_time
 
 
+def get_ymd_array(yyyymmdd):
+    """This function is the array version of get_ymd: it extracts
+       year and month values from an array of yyyymmdd dates
+
+        The month value is rounded up if the day is above 16
+
+    Parameters
+    ---------
+    yyyymmdd: array
+        dates in yyyymmdd format
+
+    Returns
+    -------
+    year: array
+        years
+    month: array
+        months
+    """
+    yyyymmdd = np.asarray(yyyymmdd, dtype=int)
+    year = yyyymmdd // 10000
+    month = (yyyymmdd // 100) % 100 + (yyyymmdd % 100 > 16)
+    return (year, month)
+
+
+def get_lifetime_array(start_date, end_date):
+    """This function is the array version of get_lifetime: it gets the
+       lifetimes of prototypes given their start and end dates.
+
+    Parameters
+    ---------
+    start_date: array
+        start dates of reactors - first criticality.
+    end_date: array
+        end dates of reactors - -1 if not listed or unknown
+
+    Returns
+    -------
+    lifetime: array
+        lifetimes of the prototypes in months, 720 where end_date is -1
+
+    """
+    end_year, end_month = get_ymd_array(end_date)
+    start_year, start_month = get_ymd_array(start_date)
+    month_difference = end_month - start_month
+    lifetime = 12 * (end_year - start_year) + month_difference
+    # same as get_lifetime, which takes a year off the year difference
+    # and moves the start month a year later when the end month is
+    # before the start month.
+    lifetime -= np.where(month_difference < 0, 24, 0)
+    return np.where(np.asarray(end_date) != -1, lifetime, 720)
+
+
+def get_entrytime_array(init_date, start_date):
+    """This function is the array version of get_entrytime: it gets the
+       entry timesteps of prototypes given their start dates.
+
+    Parameters
+    ---------
+    init_date: int
+        start date of simulation
+    start_date: array
+        start dates of reactors - first criticality.
+
+    Returns
+    -------
+    entry_time: array
+        timesteps of the prototypes to enter
+
+    """
+    init_year, init_month = get_ymd(init_date)
+    start_year, start_month = get_ymd_array(start_date)
+    return 12 * (start_year - init_year) + (start_month - init_month)
+
+
+def get_deployment_times(init_date, start_date, end_date):
+    """This function gets the entry timesteps and lifetimes of a whole
+       fleet. Reactors that start before the simulation enter at
+       timestep 1 with their lifetime shortened accordingly (to no less
+       than 0).
+
+    Parameters
+    ---------
+    init_date: int
+        start date of simulation
+    start_date: array
+        start dates of reactors - first criticality.
+    end_date: array
+        end dates of reactors - -1 if not listed or unknown
+
+    Returns
+    -------
+    entry_time: array
+        timesteps of the prototypes to enter
+    lifetime: array
+        lifetimes of the prototypes in months
+
+    """
+    entry_time = get_entrytime_array(init_date, start_date)
+    lifetime = get_lifetime_array(start_date, end_date)
+    early = entry_time <= 0
+    lifetime = np.where(early, np.maximum(lifetime + entry_time, 0),
+                        lifetime)
+    entry_time = np.where(early, 1, entry_time)
+    return entry_time, lifetime
+
+
+def _load_template(name):
+    """ Loads the source of a template in template_collections by name,
+        for the jinja environment of this module.
+    """
+    source = getattr(template_collections, name, None)
+    if not isinstance(source, str):
+        return None
+    # the template collection does not change while the process runs
+    return source, None, lambda: True
+
+
+# shared jinja environment: templates are compiled lazily on first use
+# and kept in its LRU cache, so each is compiled once per process.
+template_env = jinja2.Environment(
+    loader=jinja2.FunctionLoader(_load_template), cache_size=64)
+
+
+def get_template(name):
+    """ Returns the compiled jinja template of template_collections
+        with the given name.
+
+    Parameters
+    ---------
+    name: str
+        attribute name in template_collections, e.g. 'pwr_template'
+
+    Returns
+    -------
+    output_template: jinja template object
+        output template that can be 'jinja.render' -ed.
+
+    """
+    return template_env.get_template(name)
+
+
+@functools.lru_cache(maxsize=64)
+def get_fast_template(name):
+    """ Returns a fast renderer for the template of template_collections
+        with the given name: a FastTemplate, which fills the variables
+        of the pre-split template with plain string joins, or the jinja
+        template if the template uses more than plain variables.
+
+    Parameters
+    ---------
+    name: str
+        attribute name in template_collections, e.g. 'pwr_template'
+
+    Returns
+    -------
+    output_template: FastTemplate or jinja template object
+        output template that can be '.render' -ed, with the same output
+        as get_template(name).
+
+    """
+    loaded = _load_template(name)
+    if loaded is not None:
+        fast_template = specialize(loaded[0], template_env)
+        if fast_template is not None:
+            return fast_template
+    return get_template(name)
+
+
+def set_template_cache_dir(cache_dir):
+    """ Enables (or disables) the on-disk bytecode cache of the
+        template environment, so that compiled templates are shared
+        between processes on the same machine.
+
+    Parameters
+    ---------
+    cache_dir: str
+        directory for the compiled templates. The on-disk cache is
+        disabled if None.
+
+    Returns
+    -------
+    null
+
+    """
+    if cache_dir is None:
+        template_env.bytecode_cache = None
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        template_env.bytecode_cache = jinja2.FileSystemBytecodeCache(
+            cache_dir)
+    template_env.cache.clear()
+
+
+@functools.lru_cache(maxsize=64)
 def read_template(template):
     """ Returns a jinja template
 
+        Templates are compiled once per distinct template string.
+
     Parameters
     ---------
     template: str
@@ -239,18 +959,46 @@ def read_template(template):
 
     """
 
-    # takes second argument file as reactor template
-    output_template = jinja2.Template(template)
+    output_template = template_env.from_string(template)
 
     return output_template
 
 
+def group_by(reactor_data, field):
+    """ Builds an index from the values of a column to the rows
+        that hold them, with a single sort of the column.
+
+    Parameters
+    ----------
+    reactor_data: array
+        array with reactor data
+    field: str
+        name of the column to group by, e.g. 'country'
+
+    Returns
+    -------
+    index: dict
+        key: decoded column value, in sorted order
+        value: array of row indices with that value, in original order
+    """
+    keys, inverse = np.unique(reactor_data[field], return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+    index = {}
+    for key, rows in zip(keys, np.split(order, bounds)):
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        index[key] = rows
+    return index
+
+
 def refine_name(name_data):
     """ Takes the name data and decodes and refines it.
 
     Parameters
     ----------
-    name_data: str
+    name_data: bytes or str
         reactor name data from csv file
 
     Returns
@@ -258,7 +1006,9 @@ def refine_name(name_data):
     name: str
         refined and decoded name of reactor
     """
-    name = name_data.decode('utf-8')
+    name = name_data
+    if isinstance(name, bytes):
+        name = name.decode('utf-8')
     start = name.find('(')
     end = name.find(')')
     if start != -1 and end != -1:
@@ -266,131 +1016,254 @@ def refine_name(name_data):
     return name
 
 
-def reactor_render(reactor_data, output_file, is_cyborg=False):
-    """Takes the list and template and writes a reactor file
+# reactor specifications by reactor type, see register_reactor_spec
+reactor_specs = {}
+
+
+def register_reactor_spec(reactor_type, template, kg_per_assembly,
+                          assemblies_per_core, assemblies_per_batch):
+    """Adds (or replaces) the specification used to size and render
+       reactors of a type.
+
+    Parameters
+    ----------
+    reactor_type: str
+        reactor type as listed in the csv file, e.g. 'PWR'
+    template: str
+        name of the facility template in template_collections, e.g.
+        'pwr_template'. Its '_cyborg' variant is used for Cyborg inputs.
+    kg_per_assembly: float
+        assembly mass [kg]
+    assemblies_per_core: float
+        number of assemblies in the core per MWe of capacity
+    assemblies_per_batch: float
+        number of assemblies in a batch per MWe of capacity
+
+    Returns
+    -------
+    null
+
+    """
+    reactor_specs[reactor_type] = {
+        'template': template,
+        'kg_per_assembly': kg_per_assembly,
+        'assemblies_per_core': assemblies_per_core,
+        'assemblies_per_batch': assemblies_per_batch}
+
+
+register_reactor_spec('AP1000', 'pwr_template', 446.0,
+                      157 / 1110.0, 52 / 3330.0)
+register_reactor_spec('PHWR', 'candu_template', 8000 / 473,
+                      473 / 500.0, 60)
+register_reactor_spec('BWR', 'pwr_template', 180,
+                      764 / 1000.0, 764 / 3000.0)
+register_reactor_spec('CANDU', 'candu_template', 8000 / 473,
+                      473 / 500.0, 60)
+register_reactor_spec('PWR', 'pwr_template', 446.0,
+                      193 / 1000.0, 193 / 3000.0)
+register_reactor_spec('EPR', 'pwr_template', 467.0, 216, 72)
+
+
+def reactor_sizing(reactor_types, capacity):
+    """Computes the template, assembly size and core and batch sizes of
+       a whole fleet in one vectorized pass over a lookup table built
+       from reactor_specs.
+
+       Reactor types without a specification use the pwr template with
+       a 1000MWe pwr linear core size model: 523.4 kg assemblies, 193
+       assemblies per 1000MWe core (rounded) and a third of that per
+       batch.
+
+    Parameters
+    ----------
+    reactor_types: array
+        reactor type of every reactor (str)
+    capacity: array
+        net electricity capacity of every reactor [MWe]
+
+    Returns
+    -------
+    sizing: dict
+        'template': template names, 'assem_size': assembly masses,
+        'n_assem_core' and 'n_assem_batch': assembly counts,
+        each a list with one entry per reactor
+
+    """
+    # lookup table: one row per registered type, plus the default
+    spec_list = list(reactor_specs.values())
+    templates = np.array([spec['template'] for spec in spec_list]
+                         + ['pwr_template'], dtype=object)
+    # keeps the number formatting of the spec (e.g. 180, not 180.0)
+    assem_sizes = np.array([round(spec['kg_per_assembly'], 3)
+                            for spec in spec_list] + [523.4], dtype=object)
+    per_core = np.array([spec['assemblies_per_core'] for spec in spec_list]
+                        + [0.0], dtype=float)
+    per_batch = np.array([spec['assemblies_per_batch']
+                          for spec in spec_list] + [0.0], dtype=float)
+
+    # map every distinct type to its row, unknown types to the default
+    spec_rows = {reactor_type: indx
+                 for indx, reactor_type in enumerate(reactor_specs)}
+    unique_types, inverse = np.unique(np.asarray(reactor_types, dtype=object),
+                                      return_inverse=True)
+    rows = np.array([spec_rows.get(reactor_type, len(spec_list))
+                     for reactor_type in unique_types],
+                    dtype=int)[inverse.reshape(-1)]
+
+    capacity = np.asarray(capacity)
+    known = rows < len(spec_list)
+    n_assem_core = np.where(known, np.trunc(per_core[rows] * capacity),
+                            np.round(capacity / 1000 * 193))
+    n_assem_batch = np.where(known, np.trunc(per_batch[rows] * capacity),
+                             np.round(capacity / 3000 * 193))
+
+    return {'template': templates[rows].tolist(),
+            'assem_size': assem_sizes[rows].tolist(),
+            'n_assem_core': n_assem_core.astype(int).tolist(),
+            'n_assem_batch': n_assem_batch.astype(int).tolist()}
+
+
+def shared_prototype_names(reactor_data):
+    """Assigns every reactor the shared prototype of its configuration.
+
+       The facility config of a reactor only depends on its type and
+       capacity, so reactors that share both share one prototype,
+       named '<type>_<capacity>MWe'.
+
+    Parameters
+    ----------
+    reactor_data: list
+        list of data on reactors
+
+    Returns
+    -------
+    prototypes: array
+        shared prototype name of every reactor (str)
+    first_rows: array
+        row of the first reactor of every prototype, in order of
+        first appearance
+
+    """
+    reactor_types = decode_column(reactor_data['type'])
+    capacity = np.asarray(reactor_data['net_elec_capacity'])
+    keys = np.array(['%s_%iMWe' % (reactor_type.replace(' ', '_'), power)
+                     for reactor_type, power in zip(reactor_types, capacity)],
+                    dtype=object)
+    first_rows = np.unique(keys, return_index=True)[1]
+    return keys, np.sort(first_rows)
+
+
+def reactor_stream(reactor_data, is_cyborg=False, fast=True,
+                   shared_prototypes=False):
+    """Takes the list and template and yields the rendered facility
+       block of every reactor, one at a time.
+
+    Parameters
+    ----------
+    reactor_data: list
+        list of data on reactors
+    is_cyborg: bool
+        if True, uses Cyborg templates
+    fast: bool
+        if True, renders through get_fast_template, otherwise through
+        jinja. Both give the same output.
+    shared_prototypes: bool
+        if True, yields one facility block per shared prototype (see
+        shared_prototype_names) instead of one per reactor, listing
+        the countries of all its reactors.
+
+    Yields
+    ------
+    reactor_body: str
+        facility block of a reactor (or shared prototype),
+        in the order of reactor_data
+
+    """
+    # decode the text columns and size the cores once for the whole fleet
+    countries = decode_column(reactor_data['country'])
+    names = decode_column(reactor_data['reactor_name'])
+    reactor_types = decode_column(reactor_data['type'])
+    capacity = np.asarray(reactor_data['net_elec_capacity'])
+    sizing = reactor_sizing(reactor_types, capacity)
+
+    if shared_prototypes:
+        prototypes, rows = shared_prototype_names(reactor_data)
+        prototype_countries = {}
+        for prototype, country in zip(prototypes, countries):
+            prototype_countries.setdefault(prototype, set()).add(country)
+        names = prototypes
+        countries = {indx: ', '.join(sorted(prototype_countries[
+                         prototypes[indx]])) for indx in rows}
+    else:
+        names = [refine_name(name) for name in names]
+        rows = range(len(capacity))
+
+    suffix = '_cyborg' if is_cyborg else ''
+    lookup = get_fast_template if fast else get_template
+    for indx in rows:
+        template = lookup(sizing['template'][indx] + suffix)
+        yield template.render(
+            country=countries[indx],
+            type=reactor_types[indx],
+            reactor_name=names[indx],
+            assem_size=sizing['assem_size'][indx],
+            n_assem_core=sizing['n_assem_core'][indx],
+            n_assem_batch=sizing['n_assem_batch'][indx],
+            capacity=capacity[indx])
+
+
+def reactor_render(reactor_data, output_file=None, is_cyborg=False):
+    """Takes the list and template and renders the reactor section
 
     Parameters
     ----------
     reactor_data: list
         list of data on reactors
-    template: jinja.template
-        jinja template for reactor file
-    mox_template: jinja.template
-        jinja template for mox reactor file
     output_file: str
-        name of output file
+        name of output file the section is appended to, if given
     is_cyborg: bool
         if True, uses Cyborg templates
 
     Returns
     -------
-    The reactor section of cyclus input file
-
-    """
-
-    pwr_template = read_template(template_collections.pwr_template)
-    mox_reactor_template = read_template(template_collections.mox_template)
-    candu_template = read_template(template_collections.candu_template)
-
-    if is_cyborg:
-        pwr_template = read_template(template_collections.pwr_template_cyborg)
-        mox_reactor_template = read_template(template_collections.mox_template_cyborg)
-        candu_template = read_template(template_collections.candu_template_cyborg)
-
-    ap1000_spec = {'template': pwr_template,
-                   'kg_per_assembly': 446.0,
-                   'assemblies_per_core': 157 / 1110.0,
-                   'assemblies_per_batch': 52 / 3330.0}
-    bwr_spec = {'template': pwr_template,
-                'kg_per_assembly': 180,
-                'assemblies_per_core': 764 / 1000.0,
-                'assemblies_per_batch': 764 / 3000.0}
-    phwr_spec = {'template': candu_template,
-                 'kg_per_assembly': 8000 / 473,
-                 'assemblies_per_core': 473 / 500.0,
-                 'assemblies_per_batch': 60}
-    candu_spec = {'template': candu_template,
-                  'kg_per_assembly': 8000 / 473,
-                  'assemblies_per_core': 473 / 500.0,
-                  'assemblies_per_batch': 60}
-    pwr_spec = {'template': pwr_template,
-                'kg_per_assembly': 446.0,
-                'assemblies_per_core': 193 / 1000.0,
-                'assemblies_per_batch': 193 / 3000.0}
-    epr_spec = {'template': pwr_template,
-                'kg_per_assembly': 467.0,
-                'assemblies_per_core': 216,
-                'assemblies_per_batch': 72}
-
-    reactor_specs = {'AP1000': ap1000_spec,
-                     'PHWR': phwr_spec,
-                     'BWR': bwr_spec,
-                     'CANDU': candu_spec,
-                     'PWR': pwr_spec,
-                     'EPR': epr_spec}
-
-    for data in reactor_data:
-        # refine name string
-        name = refine_name(data['reactor_name'])
-        reactor_type = data['type'].decode('utf-8')
-        if reactor_type in reactor_specs.keys():
-            # if the reactor type matches with the pre-defined dictionary,
-            # use the specifications in the dictionary.
-            spec_dict = reactor_specs[reactor_type]
-            reactor_body = spec_dict['template'].render(
-                country=data['country'].decode('utf-8'),
-                type=reactor_type,
-                reactor_name=name,
-                assem_size=round(spec_dict['kg_per_assembly'], 3),
-                n_assem_core=int((spec_dict['assemblies_per_core']
-                                       * data['net_elec_capacity'])),
-                n_assem_batch=int((spec_dict['assemblies_per_batch']
-                                        * data['net_elec_capacity'])),
-                capacity=data['net_elec_capacity'])
-        else:
-            # assume 1000MWe pwr linear core size model if no match
-            reactor_body = pwr_template.render(
-                country=data['country'].decode('utf-8'),
-                reactor_name=name,
-                type=reactor_type,
-                assem_size=523.4,
-                n_assem_core=int(
-                    round(data['net_elec_capacity'] / 1000 * 193)),
-                n_assem_batch=int(
-                    round(data['net_elec_capacity'] / 3000 * 193)),
-                capacity=data['net_elec_capacity'])
+    reactor_input: str
+        The reactor section of cyclus input file
 
+    """
+    reactor_input = ''.join(reactor_stream(reactor_data, is_cyborg))
+    if output_file is not None:
         with open(output_file, 'a') as output:
-            output.write(reactor_body)
+            output.write(reactor_input)
+    return reactor_input
 
 
-def input_render(init_date, duration, reactor_file,
-                 region_file, output_file, reprocessing):
-    """Creates total input file from region and reactor file
+def input_stream(init_date, duration, reactor_chunks,
+                 region_chunks, reprocessing):
+    """Yields the complete input file in chunks, passing the reactor
+       and region chunks through as they are produced.
 
     Parameters
     ---------
     init_date: int
         date of desired start of simulation (format yyyymmdd)
-    reactor_file: str
-        jinja rendered reactor section of cyclus input file
-    region_file: str
-        jinja rendered region section of cylcus input file
-    output_file: str
-        name of output file
+    duration: int
+        duration of the simulation in months
+    reactor_chunks: iterable of str
+        rendered reactor section of cyclus input file,
+        e.g. from reactor_stream
+    region_chunks: iterable of str
+        rendered region section of cyclus input file,
+        e.g. from region_stream
     reprocessing: bool
         True if reprocessing is done, false if ignored
 
-    Returns
-    -------
-    A complete cylus input file.
+    Yields
+    ------
+    chunk: str
+        consecutive pieces of the complete cyclus input file
 
     """
-    template = read_template(template_collections.input_template)
-    with open(reactor_file, 'r') as fp:
-        reactor = fp.read()
-    with open(region_file, 'r') as bae:
-        region = bae.read()
+    template = get_template('input_template')
 
     startyear, startmonth = get_ymd(init_date)
 
@@ -402,107 +1275,240 @@ def input_render(init_date, duration, reactor_file,
                               + '</entry>')
     else:
         reprocessing_chunk = ''
-    # renders template
+    # renders template with markers where the sections are streamed in
+    reactor_slot = '\x00reactor_input\x00'
+    region_slot = '\x00region_input\x00'
     rendered_template = template.render(duration=duration,
                                         startmonth=startmonth,
                                         startyear=startyear,
                                         reprocessing=reprocessing_chunk,
-                                        reactor_input=reactor,
-                                        region_input=region)
+                                        reactor_input=reactor_slot,
+                                        region_input=region_slot)
+    head, rest = rendered_template.split(reactor_slot)
+    middle, tail = rest.split(region_slot)
 
-    with open(output_file, 'w') as output:
-        output.write(rendered_template)
+    yield head
+    for chunk in reactor_chunks:
+        yield chunk
+    yield middle
+    for chunk in region_chunks:
+        yield chunk
+    yield tail
 
-    os.system('rm reactor_output.xml.in region_output.xml.in')
 
+def input_render(init_date, duration, reactor_input,
+                 region_input, output_file, reprocessing):
+    """Creates total input file from region and reactor sections
 
-def region_render(reactor_data, output_file):
-    """Takes the list and template and writes a region file
+    Parameters
+    ---------
+    init_date: int
+        date of desired start of simulation (format yyyymmdd)
+    duration: int
+        duration of the simulation in months
+    reactor_input: str
+        jinja rendered reactor section of cyclus input file
+    region_input: str
+        jinja rendered region section of cylcus input file
+    output_file: str
+        name of output file
+    reprocessing: bool
+        True if reprocessing is done, false if ignored
+
+    Returns
+    -------
+    A complete cylus input file.
+
+    """
+    write_stream(input_stream(init_date, duration, [reactor_input],
+                              [region_input], reprocessing),
+                 output_file)
+
+
+def write_stream(chunks, output_file, buffer_size=1 << 20):
+    """Writes chunks of text through a single buffered handle
+
+    Parameters
+    ---------
+    chunks: iterable of str
+        text chunks, e.g. from input_stream
+    output_file: str or file object
+        name of output file, or any open text stream
+        (file, gzip.open(..., 'wt'), socket.makefile('w'), ...).
+        A named output file is replaced atomically once complete.
+    buffer_size: int
+        buffer size in bytes when output_file is a file name
+
+    Returns
+    -------
+    null
+
+    """
+    if isinstance(output_file, str):
+        # write to a private temporary file next to the output and move
+        # it in place, so concurrent runs never interleave their output
+        directory, name = os.path.split(os.path.abspath(output_file))
+        fd, tmp_file = create_temp_file(directory, prefix='.' + name)
+        try:
+            with os.fdopen(fd, 'w', buffering=buffer_size) as output:
+                output.writelines(chunks)
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+    else:
+        output_file.writelines(chunks)
+
+
+def region_stream(reactor_data, shared_prototypes=False):
+    """Takes the list and template and yields the rendered region
+       block of every country, one at a time.
 
     Parameters
     ---------
     reactor_data: list
         list of data on reactors
-    output_file: str
-        name of output file
+    shared_prototypes: bool
+        if True, deploys the shared prototypes of shared_prototype_names
+        instead of one prototype per reactor
+
+    Yields
+    ------
+    region_body: str
+        region block of a country, in sorted country order
+
+    """
+    if shared_prototypes:
+        prototypes = shared_prototype_names(reactor_data)[0]
+    else:
+        prototypes = decode_column(reactor_data['reactor_name'])
+
+    # deployed reactors grouped by country, in one pass over the data
+    deployed_rows = np.flatnonzero(np.asarray(reactor_data['lifetime']) != 0)
+    deployed = reactor_data[deployed_rows]
+    country_index = group_by(deployed, 'country')
+
+    for country, rows in country_index.items():
+        # create the `region block' of the country from its reactors
+        country_data = deployed[rows]
+        country_prototypes = prototypes[deployed_rows[rows]]
+        if not shared_prototypes:
+            country_prototypes = [refine_name(name)
+                                  for name in country_prototypes]
+        region_body = render_region(country, *deployinst_values(
+            country_prototypes, country_data['entry_time'],
+            country_data['lifetime']))
+        if region_body is not None:
+            yield region_body
+
+
+def deployinst_values(prototypes, entry_time, lifetime):
+    """Renders the <val> lists of the DeployInst of a group of reactors.
+
+    Parameters
+    ---------
+    prototypes: list of str
+        prototype names of the reactors
+    entry_time: array
+        entry times of the reactors [months]
+    lifetime: array
+        lifetimes of the reactors [months]
 
     Returns
     -------
-    The region section of cyclus input file
+    prototype, start_time, number, lifetime: str
+        concatenated <val> entries, one per reactor. Lists of consecutive
+        groups of reactors can be concatenated.
+    """
+    valhead = '<val>'
+    valtail = '</val>\n'
+    return (''.join([valhead + name + valtail for name in prototypes]),
+            ''.join([valhead + str(time) + valtail for time in entry_time]),
+            (valhead + '1' + valtail) * len(prototypes),
+            ''.join([valhead + str(time) + valtail for time in lifetime]))
 
+
+def render_region(country, prototype, start_time, number, lifetime):
+    """Renders the region block of a country from its DeployInst
+       <val> lists, see deployinst_values.
+
+    Returns
+    -------
+    region_body: str
+        region block of the country, None if it deploys nothing
     """
     # template only has prototype, buildtime, n_build and lifetime
-    template = read_template(template_collections.deployinst_template)
+    template = get_fast_template('deployinst_template')
     # full template is the bigger template for the `region block'.
-    full_template = read_template(template_collections.region_output_template)
-    country_list = []
-    empty_country = []
+    full_template = get_fast_template('region_output_template')
+    render_temp = template.render(prototype=prototype,
+                                  start_time=start_time,
+                                  number=number,
+                                  lifetime=lifetime)
+    # if nothing is rendered the length will be less than 100,
+    # and the country is left out.
+    if len(render_temp) <= 100:
+        return None
+
+    # jinja render region template for the country
+    return full_template.render(country=country,
+                                country_gov=country + '_government',
+                                deployinst=render_temp)
+
+
+def write_prototype_map(reactor_data, map_file):
+    """Writes the csv file that maps every reactor to its shared
+       prototype, for post-processing of shared prototype inputs.
 
-    valhead = '<val>'
-    valtail = '</val>'
-
-    # creates list of countries and turns it into a set
-    for data in reactor_data:
-        country_list.append(data['country'].decode('utf-8'))
-    country_set = set(country_list)
-
-    for country in country_set:
-        prototype = ''
-        entry_time = ''
-        n_build = ''
-        lifetime = ''
-
-        # for every reactor data corresponding to a country, create a
-        # file with its `region block`
-        for data in reactor_data:
-            if data['country'].decode('utf-8') == country:
-                if data['lifetime'] == 0:
-                    continue
-                prototype += (valhead
-                              + refine_name(data['reactor_name'])
-                              + valtail + '\n')
-                entry_time += (valhead
-                               + str(data['entry_time']) + valtail + '\n')
-                n_build += valhead + '1' + valtail + '\n'
-                lifetime += valhead + str(data['lifetime']) + valtail + '\n'
-
-        render_temp = template.render(prototype=prototype,
-                                      start_time=entry_time,
-                                      number=n_build,
-                                      lifetime=lifetime)
-        # if nothing is rendered the length will be less than 100:
-        if len(render_temp) > 100:
-            with open(country, 'a') as output:
-                output.write(render_temp)
-        else:
-            empty_country.append(country)
+    Parameters
+    ---------
+    reactor_data: list
+        list of data on reactors
+    map_file: str
+        name of the csv file, with columns country, reactor_name
+        (as listed in the database) and prototype
 
-    # remove the countries with no values
-    for country in empty_country:
-        country_set.remove(country)
+    Returns
+    -------
+    null
 
-    for country in country_set:
-        # jinja render region template for different countries
-        with open(country, 'r') as ab:
-            country_input = ab.read()
-            country_body = full_template.render(
-                country=country,
-                country_gov=(country
-                             + '_government'),
-                deployinst=country_input)
+    """
+    prototypes = shared_prototype_names(reactor_data)[0]
+    with open(map_file, 'w', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(['country', 'reactor_name', 'prototype'])
+        writer.writerows(zip(decode_column(reactor_data['country']),
+                             decode_column(reactor_data['reactor_name']),
+                             prototypes))
 
-        # write rendered template as 'country'_region
-        with open(country + '_region', 'a') as output:
-            output.write(country_body)
 
-        # concatenate the made file to the final output file and remove temp
-        os.system('cat ' + country + '_region >> ' + output_file)
-        os.system('rm ' + country)
-        os.system('rm ' + country + '_region')
+def region_render(reactor_data, output_file=None):
+    """Takes the list and template and renders the region section
+
+    Parameters
+    ---------
+    reactor_data: list
+        list of data on reactors
+    output_file: str
+        name of output file the section is appended to, if given
+
+    Returns
+    -------
+    region_input: str
+        The region section of cyclus input file
+
+    """
+    region_input = ''.join(region_stream(reactor_data))
+    if output_file is not None:
+        with open(output_file, 'a') as output:
+            output.write(region_input)
+    return region_input
 
 
 def main(csv_file, init_date, duration,
-         country_list, output_file='complete_input.xml', reprocessing=True):
+         country_list, output_file='complete_input.xml', reprocessing=True,
+         cache_dir=None, shared_prototypes=False, prototype_map_file=None,
+         incremental=False, processes=None):
     """ Generates cyclus input file from csv files and jinja templates.
 
     Parameters
@@ -511,42 +1517,447 @@ def main(csv_file, init_date, duration,
         csv file containing reactor data (country, name, net_elec_capacity)
     init_date: int
         yyyymmdd format of initial date of simulation
-    input_template: str
-        template file for entire complete cyclus input file
+    duration: int
+        duration of the simulation in months
     country_list: list of str
         list of countries to take into account
     output_file: str
         directory and name of complete cyclus input file
     reprocessing: bool
         True if reprocessing is done, False if not
+    cache_dir: str
+        directory of the parsed database cache, not used if None
+    shared_prototypes: bool
+        if True, reactors of the same type and capacity share one
+        prototype, see shared_prototype_names
+    prototype_map_file: str
+        csv file mapping reactors to shared prototypes, written if
+        shared_prototypes is True. Defaults to the output file name
+        with a '_prototypes.csv' ending.
+    incremental: bool
+        if True, only re-renders the countries whose data changed since
+        the last run with the same output file, see generate_input
+    processes: int
+        number of worker processes for rendering, see generate_input
 
     Returns
     -------
-    File with reactor section of cyclus input file
-    File with region section of cyclus input file
     File with complete cyclus input file
 
     """
 
-    # deletes previously existing files
-    delete_file(output_file)
-    reactor_output_filename = 'reactor_output.xml.in'
-    region_output_filename = 'region_output.xml.in'
     # read csv and templates
-    csv_database = read_csv(csv_file, country_list)
-
-    for data in csv_database:
-        entry_time = get_entrytime(init_date, data['first_crit'])
-        lifetime = get_lifetime(data['first_crit'], data['shutdown_date'])
-        if entry_time <= 0:
-            lifetime = lifetime + entry_time
-            if lifetime < 0:
-                lifetime = 0
-            entry_time = 1
-        data['entry_time'] = entry_time
-        data['lifetime'] = lifetime
-    # renders reactor / region / input file.
-    reactor_render(csv_database, reactor_output_filename)
-    region_render(csv_database, region_output_filename)
-    input_render(init_date, duration, reactor_output_filename,
-                 region_output_filename, output_file, reprocessing)
+    csv_database = read_fleet(csv_file, country_list, cache_dir)
+    generate_input(csv_database, init_date, duration,
+                   output_file, reprocessing, shared_prototypes,
+                   prototype_map_file, incremental, processes)
+
+
+def generate_input(csv_database, init_date, duration,
+                   output_file, reprocessing=True, shared_prototypes=False,
+                   prototype_map_file=None, incremental=False,
+                   processes=None):
+    """ Generates cyclus input file from already read reactor data.
+
+        Facilities and regions are emitted grouped by country, in sorted
+        country order.
+
+    Parameters
+    ---------
+    csv_database: array or Fleet
+        filtered and date-normalized reactor data, e.g. from read_csv
+        or read_fleet.
+        Its entry_time and lifetime columns are filled in.
+    init_date: int
+        yyyymmdd format of initial date of simulation
+    duration: int
+        duration of the simulation in months
+    output_file: str
+        directory and name of complete cyclus input file
+    reprocessing: bool
+        True if reprocessing is done, False if not
+    shared_prototypes: bool
+        if True, reactors of the same type and capacity share one
+        prototype, see shared_prototype_names
+    prototype_map_file: str
+        csv file mapping reactors to shared prototypes, written if
+        shared_prototypes is True. Defaults to the output file name
+        with a '_prototypes.csv' ending.
+    incremental: bool
+        if True, keeps the rendered fragments of every country in a
+        manifest next to the output file ('<output_file>.manifest.json')
+        and only re-renders the countries whose data changed since the
+        last run, see country_fragments
+    processes: int
+        number of worker processes that render the facility and region
+        fragments in parallel, see country_fragments. The output is the
+        same as with serial rendering (None or 1).
+
+    Returns
+    -------
+    File with complete cyclus input file
+
+    """
+    entry_time, lifetime = get_deployment_times(
+        init_date, csv_database['first_crit'], csv_database['shutdown_date'])
+    csv_database['entry_time'] = entry_time
+    csv_database['lifetime'] = lifetime
+
+    if shared_prototypes:
+        # shared prototypes span countries, so they are always rendered
+        reactor_chunks = reactor_stream(csv_database, shared_prototypes=True)
+    if incremental or processes not in (None, 1):
+        manifest_file = output_file + '.manifest.json'
+        previous = None
+        if incremental and os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as manifest:
+                previous = json.load(manifest)
+        # the content hashes are only needed for the manifest
+        fragments = country_fragments(csv_database, shared_prototypes,
+                                      previous, processes,
+                                      hashed=incremental)[0]
+        if not shared_prototypes:
+            reactor_chunks = [fragment['facilities']
+                              for fragment in fragments.values()]
+        region_chunks = [fragment['region']
+                         for fragment in fragments.values()]
+    else:
+        if not shared_prototypes:
+            order = np.argsort(decode_column(csv_database['country']),
+                               kind='stable')
+            reactor_chunks = reactor_stream(csv_database[order])
+        region_chunks = region_stream(csv_database, shared_prototypes)
+
+    # streams the reactor / region sections into the input file.
+    write_stream(input_stream(init_date, duration, reactor_chunks,
+                              region_chunks, reprocessing),
+                 output_file)
+    if incremental:
+        write_stream([json.dumps({'version': MANIFEST_VERSION,
+                                  'countries': fragments})],
+                     manifest_file)
+    if shared_prototypes:
+        if prototype_map_file is None:
+            prototype_map_file = (os.path.splitext(output_file)[0]
+                                  + '_prototypes.csv')
+        write_prototype_map(csv_database, prototype_map_file)
+
+
+def main_chunked(csv_file, init_date, duration, country_list,
+                 output_file='complete_input.xml', reprocessing=True,
+                 block_size=10000):
+    """ Generates cyclus input file like main, out of core: the csv
+        file is read in blocks of rows and the facility blocks are
+        streamed to the output as each block is read, so peak memory is
+        bounded by the block size instead of the fleet size.
+
+        Facilities are emitted in csv order. The regions are rendered
+        at the end from per-country accumulators of the DeployInst
+        <val> lists, in sorted country order as with main.
+
+    Parameters
+    ---------
+    csv_file : str
+        csv file containing reactor data (country, name, net_elec_capacity)
+        or a .npy database store written by convert_csv
+    init_date: int
+        yyyymmdd format of initial date of simulation
+    duration: int
+        duration of the simulation in months
+    country_list: list of str
+        list of countries to take into account
+    output_file: str
+        directory and name of complete cyclus input file
+    reprocessing: bool
+        True if reprocessing is done, False if not
+    block_size: int
+        number of csv rows read at a time
+
+    Returns
+    -------
+    File with complete cyclus input file
+
+    """
+    # key: country, value: lists of the DeployInst <val> strings
+    accumulators = {}
+
+    def reactor_chunks():
+        for block in read_blocks(csv_file, country_list, block_size):
+            entry_time, lifetime = get_deployment_times(
+                init_date, block['first_crit'], block['shutdown_date'])
+            block['entry_time'] = entry_time
+            block['lifetime'] = lifetime
+            for chunk in reactor_stream(block):
+                yield chunk
+            deployed = block[lifetime != 0]
+            names = decode_column(deployed['reactor_name'])
+            for country, rows in group_by(deployed, 'country').items():
+                values = deployinst_values(
+                    [refine_name(name) for name in names[rows]],
+                    deployed['entry_time'][rows],
+                    deployed['lifetime'][rows])
+                country_values = accumulators.setdefault(country,
+                                                         ([], [], [], []))
+                for parts, value in zip(country_values, values):
+                    parts.append(value)
+
+    def region_chunks():
+        # consumed after all reactor chunks, once every block is read
+        for country in sorted(accumulators):
+            region_body = render_region(
+                country, *[''.join(parts) for parts in
+                           accumulators.pop(country)])
+            if region_body is not None:
+                yield region_body
+
+    write_stream(input_stream(init_date, duration, reactor_chunks(),
+                              region_chunks(), reprocessing), output_file)
+
+
+def template_version():
+    """ Returns a hash of everything besides the reactor data that the
+        rendered fragments depend on: the templates and reactor_specs.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(vars(template_collections)):
+        source = getattr(template_collections, name)
+        if isinstance(source, str) and not name.startswith('__'):
+            digest.update(('%s\x00%s\x00' % (name, source)).encode('utf-8'))
+    digest.update(repr(sorted(reactor_specs.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _digest_rows(digest, reactor_data, rows):
+    """ Feeds the content of the given rows to a hashlib digest, in a
+        form that does not depend on array or Fleet storage.
+    """
+    names = getattr(reactor_data, 'fields', None) or reactor_data.dtype.names
+    for name in sorted(names):
+        column = np.asarray(reactor_data[name])[rows]
+        digest.update(name.encode('utf-8'))
+        if column.dtype.kind in 'SUO':
+            digest.update('\x00'.join(decode_column(column)).encode('utf-8'))
+        elif column.dtype.kind in 'iub':
+            digest.update(column.astype('<i8').tobytes())
+        else:
+            digest.update(column.astype('<f8').tobytes())
+
+
+# reactor data of the rendering worker processes, see country_fragments
+_fragment_data = None
+
+
+def _set_fragment_data(reactor_data):
+    """ Stores the reactor data in a rendering worker process."""
+    global _fragment_data
+    _fragment_data = reactor_data
+
+
+def _render_fragment(task, reactor_data=None):
+    """ Renders the facility blocks or the region block of a set of
+        rows of the fleet, for country_fragments.
+    """
+    kind, rows, shared_prototypes = task
+    if reactor_data is None:
+        reactor_data = _fragment_data
+    if kind == 'facilities':
+        return reactor_render(reactor_data[rows])
+    return ''.join(region_stream(reactor_data[rows], shared_prototypes))
+
+
+def _pool_context():
+    """ Returns the multiprocessing context for worker pools, forking
+        where possible so that workers inherit the parent's data.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def country_fragments(csv_database, shared_prototypes=False, previous=None,
+                      processes=None, block_size=5000, hashed=True):
+    """ Renders the facility and region fragments of every country,
+        reusing the fragments of a previous run for the countries
+        whose content hash did not change.
+
+        The content hash of a country covers its rows (including
+        entry_time and lifetime), template_version(), MANIFEST_VERSION
+        and shared_prototypes. Facility blocks are rendered in blocks of
+        at most block_size reactors and region blocks per country, in a
+        process pool if processes is given; the fragments are merged in
+        sorted country and stable reactor order either way.
+
+    Parameters
+    ---------
+    csv_database: array or Fleet
+        reactor data with entry_time and lifetime filled in
+    shared_prototypes: bool
+        if True, region fragments deploy shared prototypes. Facility
+        fragments are left empty, as shared prototypes span countries.
+    previous: dict
+        manifest of a previous run, with the same layout as written by
+        generate_input: {'version': ..., 'countries': fragments}
+    processes: int
+        number of worker processes. Fragments are rendered in this
+        process if None or 1.
+    block_size: int
+        maximum number of reactors per facility rendering task
+    hashed: bool
+        if False and there is no previous manifest, the content hashes
+        are not computed ('hash' is None), e.g. for parallel rendering
+        without a manifest
+
+    Returns
+    -------
+    fragments: dict
+        key: country, in sorted order
+        value: dict with 'hash', 'facilities' and 'region'
+    rendered: list of str
+        countries that were (re-)rendered
+
+    """
+    previous_fragments = {}
+    if previous is not None and previous.get('version') == MANIFEST_VERSION:
+        previous_fragments = previous['countries']
+    version = '%s\x00%i\x00%s' % (template_version(), MANIFEST_VERSION,
+                                  bool(shared_prototypes))
+
+    fragments = {}
+    rendered = []
+    tasks = []
+    hashed = hashed or previous is not None
+    for country, rows in group_by(csv_database, 'country').items():
+        content_hash = None
+        if hashed:
+            digest = hashlib.sha256(version.encode('utf-8'))
+            _digest_rows(digest, csv_database, rows)
+            content_hash = digest.hexdigest()
+        cached = previous_fragments.get(country)
+        if cached is not None and cached['hash'] == content_hash:
+            fragments[country] = cached
+            continue
+        fragments[country] = {'hash': content_hash,
+                              'facilities': [],
+                              'region': ''}
+        rendered.append(country)
+        if not shared_prototypes:
+            for start in range(0, len(rows), block_size):
+                tasks.append((country, ('facilities',
+                                        rows[start:start + block_size],
+                                        shared_prototypes)))
+        tasks.append((country, ('region', rows, shared_prototypes)))
+
+    # workers get the reactor data once when the pool starts (inherited
+    # on fork) and only receive row indices per task
+    jobs = [job for country, job in tasks]
+    if processes is None or processes == 1:
+        results = [_render_fragment(job, csv_database) for job in jobs]
+    else:
+        with _pool_context().Pool(processes, initializer=_set_fragment_data,
+                                  initargs=(csv_database,)) as pool:
+            results = pool.map(_render_fragment, jobs, chunksize=1)
+
+    for (country, (kind, rows, shared)), result in zip(tasks, results):
+        if kind == 'facilities':
+            fragments[country]['facilities'].append(result)
+        else:
+            fragments[country]['region'] = result
+    for country in rendered:
+        fragments[country]['facilities'] = ''.join(
+            fragments[country]['facilities'])
+    return fragments, rendered
+
+
+# parsed database of the batch worker processes, see batch_main
+_batch_database = None
+
+
+def _set_batch_database(database):
+    """ Stores the parsed database in a batch worker process."""
+    global _batch_database
+    _batch_database = database
+
+
+def _batch_worker(scenario):
+    """ Renders one scenario of batch_main in a worker process."""
+    return render_scenario(_batch_database, scenario)
+
+
+def render_scenario(database, scenario):
+    """ Renders one scenario of a batch from the parsed database.
+
+    Parameters
+    ---------
+    database: array
+        parsed and date-normalized reactor data of all countries
+    scenario: dict
+        scenario spec with 'init_date', 'duration', 'country_list',
+        'output_file' and optionally 'reprocessing' (default True)
+
+    Returns
+    -------
+    summary: dict
+        'output_file', number of rendered reactors ('reactors')
+        and wall time in seconds ('seconds') of the scenario
+
+    """
+    start = time.perf_counter()
+    csv_database = filter_reactors(database, scenario['country_list'])
+    generate_input(csv_database, scenario['init_date'],
+                   scenario['duration'], scenario['output_file'],
+                   scenario.get('reprocessing', True))
+    return {'output_file': scenario['output_file'],
+            'reactors': len(csv_database),
+            'seconds': time.perf_counter() - start}
+
+
+def batch_main(csv_file, scenarios, output_dir='.', processes=None,
+               cache_dir=None):
+    """ Generates the cyclus input files of many scenarios that share
+        one csv file, in parallel.
+
+        The csv file is parsed once and handed to the worker processes
+        when the pool starts (inherited on fork), and every scenario is
+        rendered by one worker.
+
+    Parameters
+    ---------
+    csv_file : str
+        csv file containing reactor data (country, name, net_elec_capacity)
+    scenarios: list of dict
+        scenario specs with keys 'init_date', 'duration', 'country_list'
+        and optionally 'reprocessing' (default True) and 'output_file'
+        (default 'scenario_<index>.xml')
+    output_dir: str
+        directory of the output files
+    processes: int
+        number of worker processes, defaults to the number of cores.
+        Scenarios are rendered in this process if 1.
+    cache_dir: str
+        directory of the parsed database cache, not used if None
+
+    Returns
+    -------
+    summary: list of dict
+        per-scenario 'output_file', 'reactors' and 'seconds',
+        in the order of scenarios
+
+    """
+    if cache_dir is not None:
+        database = load_database(csv_file, cache_dir)
+    else:
+        database = normalize_dates(parse_csv(csv_file))
+
+    specs = []
+    for indx, scenario in enumerate(scenarios):
+        spec = dict(scenario)
+        spec['output_file'] = os.path.join(
+            output_dir, scenario.get('output_file', 'scenario_%i.xml' % indx))
+        specs.append(spec)
+
+    if processes == 1:
+        return [render_scenario(database, spec) for spec in specs]
+
+    with _pool_context().Pool(processes, initializer=_set_batch_database,
+                              initargs=(database,)) as pool:
+        return pool.map(_batch_worker, specs)
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import collections
 import os
 import sys
@@ -34,3 +35,160 @@ def test_get_new_deployment_aft():
     # check if nothing is deployed before avail timestep
     assert sum(deploy_array[:5]) == 0
     assert max(power_array) == 9
+
+
+def test_get_demand():
+    """Test if get_demand evaluates the equation over all timesteps"""
+    demand = dd.get_demand('where(t < 2, 10, 20) + np.sqrt(t)', 4)
+    assert demand.tolist() == [10, 11, 20 + np.sqrt(2), 20 + np.sqrt(3)]
+    assert dd.get_demand('100', 3).tolist() == [100, 100, 100]
+    assert dd.get_demand('a * t', 3, a=2).tolist() == [0, 2, 4]
+
+
+def test_compile_demand_whitelist():
+    """Test if compile_demand rejects anything but plain math"""
+    assert dd.compile_demand('exp(t)') is dd.compile_demand('exp(t)')
+    for demand_eq in ['__import__("os")', 't.__class__', 'np.load("f")',
+                      '"t"', '[t for t in range(3)]', '__builtins__',
+                      '_hidden * t', 'np', 'np + t', 'exp(np)',
+                      '9**9**9**9', '2**1000 * t']:
+        with pytest.raises(ValueError):
+            dd.compile_demand(demand_eq)
+    # powers of constants are bounded, powers of t are not constant
+    assert dd.get_demand('2**-3 * t**2', 3).tolist() == [0, 0.125, 0.5]
+    with pytest.raises(OverflowError):
+        dd.get_demand('(9**99)**99 * t', 3)
+    # parameters cannot shadow t or the functions
+    with pytest.raises(ValueError):
+        dd.get_demand('exp(t)', 3, exp=1)
+
+
+def test_deployment_sweep_lifetime():
+    """Test if deployment_sweep retires reactors after their lifetime
+       and redeploys to cover the lack"""
+    total_lack = np.array([5, 5, 5, 5, 5, 5, 5], dtype=float)
+    deploy_array, power_array = dd.deployment_sweep(total_lack, 2, 3,
+                                                    np.ones(7, dtype=bool))
+    assert deploy_array.tolist() == [0, 2, 0, 0, 2, 0, 0]
+    assert power_array.tolist() == [0, 4, 4, 4, 4, 4, 4]
+    # nothing is deployed when the reactor is not available
+    deploy_array, power_array = dd.deployment_sweep(total_lack, 2, 3,
+                                                    np.zeros(7, dtype=bool))
+    assert not deploy_array.any() and not power_array.any()
+
+
+def test_get_batch_deployment():
+    """Test if get_batch_deployment matches get_new_deployment for
+       every scenario"""
+    length = 10
+    prev_power = {'instA': np.zeros(length)}
+    growth = np.array([1, 2, 3])
+    lifetime = np.array([[2], [4]])
+    deploy_array, power_array = dd.get_batch_deployment(
+        prev_power, ['instA'], 'growth * t', 1, lifetime, 5, new=True,
+        chunk_size=4, growth=growth)
+    assert deploy_array.shape == (6, length)
+    for indx, (life, rate) in enumerate([(2, 1), (2, 2), (2, 3),
+                                         (4, 1), (4, 2), (4, 3)]):
+        answer = dd.get_new_deployment(prev_power, ['instA'],
+                                       '%i * t' % rate, 1, life, 5,
+                                       new=True)
+        assert deploy_array[indx].tolist() == answer[0].tolist()
+        assert power_array[indx].tolist() == answer[1].tolist()
+
+
+def test_plan_deployment_handoff():
+    """Test if plan_deployment hands off from a legacy to a new
+       technology at its availability"""
+    length = 10
+    prev_power = {'instA': np.zeros(length)}
+    technologies = [{'name': 'lwr', 'power': 1, 'lifetime': 2,
+                     'avail': (None, 5)},
+                    {'name': 'sfr', 'power': 1, 'lifetime': 2,
+                     'avail': (5, None)}]
+    deploy_dict, power_array = dd.plan_deployment(prev_power, ['instA'],
+                                                  '1*t', technologies)
+    legacy = dd.get_new_deployment(prev_power, ['instA'], '1*t', 1, 2, 5)
+    assert deploy_dict['lwr'].tolist() == legacy[0].tolist()
+    assert sum(deploy_dict['sfr'][:5]) == 0
+    assert sum(deploy_dict['sfr'][5:]) > 0
+    assert power_array.tolist() == [0, 0, 2, 2, 4, 4, 6, 6, 8, 8]
+
+
+def test_plan_deployment_share():
+    """Test if technologies of the same priority split the lack by
+       share before lower priorities fill the rest"""
+    technologies = [{'name': 'a', 'power': 1, 'lifetime': 10, 'share': 1},
+                    {'name': 'b', 'power': 1, 'lifetime': 10, 'share': 3},
+                    {'name': 'c', 'power': 0.5, 'lifetime': 10,
+                     'priority': 1}]
+    deploy_dict, power_array = dd.plan_deployment({'instA': np.zeros(3)},
+                                                  ['instA'], '10',
+                                                  technologies)
+    assert deploy_dict['a'].tolist() == [0, 2, 0]
+    assert deploy_dict['b'].tolist() == [0, 7, 0]
+    assert deploy_dict['c'].tolist() == [0, 2, 0]
+    assert power_array.tolist() == [0, 10, 10]
+
+
+def test_get_power_dict():
+    """Test if get_power_dict accumulates the capacity of every country
+       over the lifetime of its reactors"""
+    reactor_data = np.array([(b'France', 1000, 90., 1, 3),
+                             (b'France', 500, np.nan, 2, 10),
+                             (b'Spain', 800, 50., 0, 0)],
+                            dtype=[('country', 'S10'),
+                                   ('net_elec_capacity', 'i4'),
+                                   ('ucf', 'f8'), ('entry_time', 'i4'),
+                                   ('lifetime', 'i4')])
+    power_dict = dd.get_power_dict(reactor_data, 5)
+    assert sorted(power_dict) == ['France', 'Spain']
+    assert power_dict['France'].tolist() == [0, 1000, 1500, 1500, 500]
+    assert power_dict['Spain'].tolist() == [0, 0, 0, 0, 0]
+    weighted = dd.get_power_dict(reactor_data, 5, ucf=True, scale=0.001,
+                                 institutions={'France': 'EDF'})
+    assert list(weighted) == ['EDF']
+    assert np.allclose(weighted['EDF'], [0, 0.9, 1.4, 1.4, 0.5])
+
+
+def test_get_batch_deployment_processes():
+    """Test if get_batch_deployment gives the same result in a process
+       pool as in this process"""
+    prev_power = {'instA': np.linspace(0, 5, 20)}
+    args = (prev_power, ['instA'], 'growth * t', 1,
+            np.array([[3], [6]]), 4)
+    growth = np.array([0.5, 1, 2])
+    serial = dd.get_batch_deployment(*args, new=True, chunk_size=2,
+                                     growth=growth)
+    parallel = dd.get_batch_deployment(*args, new=True, chunk_size=2,
+                                       processes=2, growth=growth)
+    assert serial[0].shape == (6, 20)
+    assert serial[0].any()
+    assert np.array_equal(serial[0], parallel[0])
+    assert np.array_equal(serial[1], parallel[1])
+
+
+def test_plan_deployment_duplicate_names():
+    """Test if plan_deployment rejects technologies with the same name"""
+    technologies = [{'name': 'lwr', 'power': 1, 'lifetime': 2},
+                    {'name': 'lwr', 'power': 2, 'lifetime': 4}]
+    with pytest.raises(ValueError):
+        dd.plan_deployment({'instA': np.zeros(5)}, ['instA'], '1*t',
+                           technologies)
+
+
+def test_get_power_dict_institutions():
+    """Test if get_power_dict merges the countries of an institution
+       and leaves unlisted countries out"""
+    reactor_data = np.array([(b'France', 1000, 1, 3),
+                             (b'Belgium', 500, 2, 2),
+                             (b'Spain', 800, 0, 5),
+                             (b'France', 200, 3, 5)],
+                            dtype=[('country', 'S10'),
+                                   ('net_elec_capacity', 'i4'),
+                                   ('entry_time', 'i4'), ('lifetime', 'i4')])
+    power_dict = dd.get_power_dict(reactor_data, 5,
+                                   institutions={'France': 'EDF',
+                                                 'Belgium': 'EDF'})
+    assert list(power_dict) == ['EDF']
+    assert power_dict['EDF'].tolist() == [0, 1000, 1500, 1700, 200]
@@ -0,0 +1,44 @@
+import jinja2
+import pytest
+import cyclus_input_gen.from_pris as fp
+from cyclus_input_gen.fast_template import FastTemplate, specialize
+from cyclus_input_gen.templates import template_collections
+
+template_names = [name for name in vars(template_collections)
+                  if name.endswith('_template')
+                  or name.endswith('_template_cyborg')]
+
+
+@pytest.mark.parametrize('name', template_names)
+def test_fast_template_matches_jinja(name):
+    """Test if the fast renderer gives the same output as jinja for
+       every template of the collection"""
+    context = {'country': 'France', 'type': 'PWR', 'reactor_name': 'X',
+               'assem_size': 446.0, 'n_assem_core': 157,
+               'n_assem_batch': 52, 'capacity': 1110,
+               'country_gov': 'France_government', 'deployinst': 'd',
+               'prototype': 'p', 'start_time': 1, 'number': 2,
+               'lifetime': 720, 'duration': 1200, 'startmonth': 1,
+               'startyear': 1970, 'reprocessing': '',
+               'reactor_input': 'r', 'region_input': None}
+    fast_template = fp.get_fast_template(name)
+    assert isinstance(fast_template, FastTemplate)
+    assert (fast_template.render(**context)
+            == fp.get_template(name).render(**context))
+
+
+def test_specialize_missing_variable():
+    """Test if missing variables render empty, as in jinja"""
+    source = 'a {{ x }} b {{y}}\r\nc\n'
+    fast_template = specialize(source, jinja2.Environment())
+    assert fast_template.render(y=2) == jinja2.Template(source).render(y=2)
+
+
+def test_specialize_fallback():
+    """Test if templates with more than plain variables are not
+       specialized"""
+    environment = jinja2.Environment()
+    assert specialize('{% if x %}a{% endif %}', environment) is None
+    assert specialize('{{ x | upper }}', environment) is None
+    assert specialize('{{ range }}', environment) is None
+    assert specialize('{{ x }}', jinja2.Environment(autoescape=True)) is None
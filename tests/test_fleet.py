@@ -0,0 +1,101 @@
+import numpy as np
+import os
+import cyclus_input_gen.from_pris as fp
+from cyclus_input_gen.fleet import Fleet, FleetIndex, decode_column
+
+dir = os.path.dirname(__file__)
+test_database_path = os.path.join(dir, 'test_database.csv')
+
+
+def test_decode_column():
+    """Test if decode_column decodes a column of byte strings"""
+    column = np.array([b'PWR', b'BWR', b'PWR'])
+    assert decode_column(column).tolist() == ['PWR', 'BWR', 'PWR']
+
+
+def test_fleet_columns():
+    """Test if the Fleet stores categorical codes with a shared
+       dictionary and returns decoded columns"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    fleet = Fleet.from_array(reactor_array)
+    assert len(fleet) == 3
+    assert fleet.codes('country').dtype == np.int32
+    assert fleet['country'].tolist() == ['France', 'Czech_Republic',
+                                         'Czech_Republic']
+    assert fleet['type'].tolist() == ['PWR', 'AP1000', 'AP1000']
+    assert fleet['first_crit'].tolist() == [19991127, 20350101, 20400101]
+    assert fleet.nbytes < reactor_array.nbytes
+
+
+def test_fleet_reactor_view():
+    """Test if a Reactor view reads and writes its row"""
+    fleet = fp.read_fleet(test_database_path, ['Czech_Republic'])
+    reactor = fleet[-1]
+    assert reactor.reactor_name == 'TEMELIN-4'
+    assert reactor['net_elec_capacity'] == 1200
+    reactor['lifetime'] = 720
+    assert fleet['lifetime'].tolist() == [-1, 720]
+    assert not hasattr(reactor, '__dict__')
+
+
+def test_fleet_take():
+    """Test if selecting rows returns a Fleet sharing the dictionary"""
+    fleet = fp.read_fleet(test_database_path, ['France', 'Czech_Republic'])
+    subset = fleet[fleet['net_elec_capacity'] == 1200]
+    assert isinstance(subset, Fleet)
+    assert subset.strings is fleet.strings
+    assert subset['reactor_name'].tolist() == ['TEMELIN-3', 'TEMELIN-4']
+
+
+def test_fleet_to_array():
+    """Test if to_array restores the structured array"""
+    reactor_array = fp.read_csv(test_database_path, ['France'])
+    restored = Fleet.from_array(reactor_array).to_array()
+    assert restored['country'].tolist() == [b'France']
+    assert restored['reactor_name'].tolist() == [b'CIVAUX-2']
+    assert restored['shutdown_date'].tolist() == [-1]
+
+
+def test_render_fleet(tmpdir):
+    """Test if the renderers give the same output for a Fleet"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    fleet = Fleet.from_array(reactor_array)
+    assert fp.reactor_render(fleet) == fp.reactor_render(reactor_array)
+    array_file = str(tmpdir.join('array.xml'))
+    fleet_file = str(tmpdir.join('fleet.xml'))
+    fp.generate_input(reactor_array, 19700101, 1200, array_file)
+    fp.generate_input(fleet, 19700101, 1200, fleet_file)
+    with open(array_file, 'r') as array_output:
+        with open(fleet_file, 'r') as fleet_output:
+            assert array_output.read() == fleet_output.read()
+
+
+def test_fleet_query():
+    """Test if Query combines conditions on the sorted indexes"""
+    reactor_array = fp.normalize_dates(fp.parse_csv(test_database_path))
+    index = FleetIndex(reactor_array)
+    query = index.query().where('type', ['PWR', 'AP1000'])
+    mask = np.isin(reactor_array['type'], [b'PWR', b'AP1000'])
+    assert query.rows().tolist() == np.nonzero(mask)[0].tolist()
+    query = query.between('net_elec_capacity', 900)
+    mask &= reactor_array['net_elec_capacity'] >= 900
+    assert query.rows().tolist() == np.nonzero(mask)[0].tolist()
+    query = query.between('first_crit', high=20351231)
+    mask &= ((reactor_array['first_crit'] <= 20351231)
+             & (reactor_array['first_crit'] != -1))
+    assert query.fleet()['reactor_name'].tolist() == [
+        name.decode('utf-8') for name in reactor_array['reactor_name'][mask]]
+    assert len(index.query().where('status', 'Unknown status')) == 0
+    assert len(index.query()) == len(reactor_array)
+
+
+def test_fleet_query_within():
+    """Test if within selects a lat/long bounding box, skipping nan"""
+    reactor_array = np.array([(10., 20.), (np.nan, 20.), (60., 20.)],
+                             dtype=[('lat', 'f8'), ('long', 'f8')])
+    index = FleetIndex(reactor_array)
+    assert index.query().within(lat=(0, 50)).rows().tolist() == [0]
+    assert index.query().within(lat=(0, None),
+                                long=(10, 30)).rows().tolist() == [0, 2]
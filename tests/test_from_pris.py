@@ -1,6 +1,9 @@
 import numpy as np
 import collections
+import concurrent.futures
+import io
 import os
+import pytest
 import sys
 import cyclus_input_gen.from_pris as fp
 
@@ -8,6 +11,19 @@ dir = os.path.dirname(__file__)
 test_database_path = os.path.join(dir, 'test_database.csv')
 
 
+def padded_database(tmpdir):
+    """Writes a copy of the test database with spaces around the
+       fields and returns its path"""
+    with open(test_database_path, 'r') as src:
+        lines = src.readlines()
+    padded_file = str(tmpdir.join('padded_database.csv'))
+    with open(padded_file, 'w') as dst:
+        dst.writelines(lines[:2])
+        dst.writelines(' ' + line.rstrip('\n').replace(',', ' ,  ') + ' \n'
+                       for line in lines[2:])
+    return padded_file
+
+
 def test_read_csv():
     """Test if read_csv returns the correct list with key"""
     reactor_array = fp.read_csv(test_database_path,
@@ -78,3 +94,519 @@ def test_refine_name():
     string = 'Charles(Bukowski)'
     string = string.encode('utf-8')
     assert fp.refine_name(string) == 'Charles'
+
+
+def test_reactor_mask():
+    """Test if reactor_mask selects by country and capacity"""
+    test = np.array([(b'France', 85), (b'France', 1200),
+                     (b'Spain', 1000), (b'Japan', 900)],
+                    dtype=[('country', 'S10'), ('net_elec_capacity', 'i4')])
+    mask = fp.reactor_mask(test, ['France', 'Japan'])
+    assert mask.tolist() == [False, True, False, True]
+
+
+def test_filter_reactors():
+    """Test if filter_reactors returns the compacted array"""
+    test = np.array([(b'France', 85), (b'France', 1200), (b'Spain', 1000)],
+                    dtype=[('country', 'S10'), ('net_elec_capacity', 'i4')])
+    filtered = fp.filter_reactors(test, ['Spain'], min_capacity=None)
+    assert filtered['country'].tolist() == [b'Spain']
+    assert len(fp.filter_reactors(test)) == 2
+
+
+def test_filter_reactors_type_status_dates():
+    """Test if filter_reactors filters by type, status and date windows"""
+    test = np.array([(b'PWR', b'Operational', 19800101, 1000),
+                     (b'BWR', b'Operational', 19900101, 1000),
+                     (b'PWR', b'Shutdown', -1, 1000)],
+                    dtype=[('type', 'S10'), ('status', 'S20'),
+                           ('first_crit', 'i8'),
+                           ('net_elec_capacity', 'i4')])
+    assert len(fp.filter_reactors(test, reactor_types=['PWR'])) == 2
+    assert len(fp.filter_reactors(test, statuses=['Operational'])) == 2
+    windowed = fp.filter_reactors(
+        test, date_windows={'first_crit': (19850101, None)})
+    assert windowed['type'].tolist() == [b'BWR']
+    assert len(fp.filter_reactors(
+        test, date_windows={'first_crit': (None, 20000101)})) == 2
+
+
+def test_read_csv_filtered():
+    """Test if read_csv_filtered matches filtering the parsed database"""
+    filters = {'country_list': ['France', 'Czech_Republic'],
+               'reactor_types': ['PWR'],
+               'date_windows': {'first_grid': (19800101, None)}}
+    filtered = fp.read_csv_filtered(test_database_path, **filters)
+    answer = fp.filter_reactors(
+        fp.normalize_dates(fp.parse_csv(test_database_path)), **filters)
+    assert filtered.dtype == answer.dtype
+    assert filtered.tobytes() == answer.tobytes()
+    assert len(fp.read_csv_filtered(test_database_path, ['Atlantis'])) == 0
+
+
+def test_convert_csv(tmpdir):
+    """Test if convert_csv writes a store that opens memory-mapped and
+       matches the parsed csv file"""
+    store_file = str(tmpdir.join('database.npy'))
+    assert fp.convert_csv(test_database_path, store_file, block_size=3) == 4
+    reactor_array = fp.open_database(store_file)
+    assert isinstance(reactor_array, np.memmap)
+    answer = fp.normalize_dates(fp.parse_csv(test_database_path))
+    assert reactor_array.tobytes() == answer.tobytes()
+    assert os.listdir(str(tmpdir)) == ['database.npy']
+
+
+def test_convert_csv_padded(tmpdir):
+    """Test if a store converted from a csv file with padded fields
+       holds the same data as the parsed csv file, with a fixed dtype"""
+    padded_file = padded_database(tmpdir)
+    store_file = str(tmpdir.join('database.npy'))
+    fp.convert_csv(padded_file, store_file)
+    reactor_array = fp.open_database(store_file)
+    assert reactor_array.dtype['first_crit'].str == '<i8'
+    assert reactor_array.dtype['ucf'].str == '<f8'
+    answer = fp.normalize_dates(fp.parse_csv(padded_file))
+    assert answer.dtype == reactor_array.dtype
+    assert reactor_array.tobytes() == answer.tobytes()
+    countries = ['France', 'Czech_Republic']
+    assert (fp.read_csv(store_file, countries).tobytes()
+            == fp.read_csv(padded_file, countries).tobytes())
+
+
+def test_read_csv_store(tmpdir):
+    """Test if read_csv filters a database store block by block"""
+    store_file = str(tmpdir.join('database.npy'))
+    fp.convert_csv(test_database_path, store_file)
+    countries = ['France', 'Czech_Republic']
+    filtered = fp.filter_reactors(fp.open_database(store_file), countries,
+                                  block_size=2)
+    assert not isinstance(filtered, np.memmap)
+    answer = fp.read_csv(test_database_path, countries)
+    assert filtered.tobytes() == answer.tobytes()
+    assert fp.read_csv(store_file, countries).tobytes() == answer.tobytes()
+
+
+def test_read_csv_filtered_padded(tmpdir):
+    """Test if read_csv_filtered and read_csv strip padded fields alike"""
+    padded_file = padded_database(tmpdir)
+    countries = ['France', 'Czech_Republic']
+    filtered = fp.read_csv_filtered(padded_file, countries)
+    answer = fp.read_csv(test_database_path, countries)
+    assert fp.read_csv(padded_file, countries).tobytes() == answer.tobytes()
+    assert filtered.tobytes() == answer.tobytes()
+
+
+def test_std_date_format():
+    """Test if std_date_format converts the PRIS date formats"""
+    assert fp.std_date_format(b'2/25/2018') == 20180225
+    assert fp.std_date_format(b'2018') == 20180101
+    assert fp.std_date_format(b'20180225') == 20180225
+    assert fp.std_date_format(b'') == -1
+
+
+def test_std_date_array():
+    """Test if std_date_array converts a whole column of dates"""
+    column = np.array([b'2/25/2018', b'', b'1970', b'2/25/2018'],
+                      dtype='S128')
+    answer = [20180225, -1, 19700101, 20180225]
+    assert fp.std_date_array(column).tolist() == answer
+
+
+def test_read_csv_dates():
+    """Test if read_csv returns integer date columns"""
+    reactor_array = fp.read_csv(test_database_path, ['France'])
+    assert reactor_array['first_crit'].tolist() == [19991127]
+    assert reactor_array['shutdown_date'].tolist() == [-1]
+
+
+def test_load_database_cache(tmpdir):
+    """Test if load_database caches the parsed database and
+       invalidates it when the csv file changes"""
+    csv_file = str(tmpdir.join('database.csv'))
+    cache_dir = str(tmpdir.join('cache'))
+    with open(test_database_path, 'r') as src:
+        lines = src.readlines()
+    with open(csv_file, 'w') as dst:
+        dst.writelines(lines)
+    first = fp.load_database(csv_file, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    assert first['first_crit'][1] == 19991127
+    assert fp.load_database(csv_file, cache_dir).tobytes() == first.tobytes()
+
+    with open(csv_file, 'w') as dst:
+        dst.writelines(lines[:-1])
+    second = fp.load_database(csv_file, cache_dir)
+    assert len(second) == len(first) - 1
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_load_database_cache_files(tmpdir, monkeypatch):
+    """Test if load_database creates cache entries with the current
+       umask and removes its temporary file when writing fails"""
+    cache_dir = str(tmpdir.join('cache'))
+    umask = os.umask(0o022)
+    try:
+        fp.load_database(test_database_path, cache_dir)
+    finally:
+        os.umask(umask)
+    cache_file = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    assert os.stat(cache_file).st_mode & 0o777 == 0o644
+
+    def failing_save(*args, **kwargs):
+        raise IOError('disk full')
+    os.remove(cache_file)
+    monkeypatch.setattr(fp.np, 'save', failing_save)
+    with pytest.raises(IOError):
+        fp.load_database(test_database_path, cache_dir)
+    assert os.listdir(cache_dir) == []
+
+
+def test_read_csv_cached(tmpdir):
+    """Test if read_csv returns the same data with the cache"""
+    countries = ['France', 'Czech_Republic']
+    cached = fp.read_csv(test_database_path, countries, str(tmpdir))
+    uncached = fp.read_csv(test_database_path, countries)
+    assert cached.tobytes() == uncached.tobytes()
+
+
+def test_main_single_output(tmpdir):
+    """Test if main writes the complete input file and nothing else"""
+    with tmpdir.as_cwd():
+        fp.main(test_database_path, 19700101, 1200,
+                ['France', 'Czech_Republic'], 'complete_input.xml')
+        assert os.listdir('.') == ['complete_input.xml']
+        with open('complete_input.xml', 'r') as output:
+            complete_input = output.read()
+    assert complete_input.count('<facility>') > 3
+    assert '<name>TEMELIN-3</name>' in complete_input
+
+
+def test_read_blocks():
+    """Test if read_blocks yields the filtered reactors block by block"""
+    countries = ['France', 'Czech_Republic']
+    blocks = list(fp.read_blocks(test_database_path, countries,
+                                 block_size=2))
+    assert len(blocks) == 2
+    answer = fp.read_csv(test_database_path, countries)
+    assert np.concatenate(blocks).tobytes() == answer.tobytes()
+
+
+def test_main_chunked(tmpdir):
+    """Test if main_chunked writes the same regions and facilities
+       as main"""
+    countries = ['France', 'Czech_Republic']
+    with tmpdir.as_cwd():
+        fp.main(test_database_path, 19700101, 1200, countries, 'main.xml')
+        fp.main_chunked(test_database_path, 19700101, 1200, countries,
+                        'chunked.xml', block_size=2)
+        with open('main.xml', 'r') as output:
+            complete_input = output.read()
+        with open('chunked.xml', 'r') as output:
+            chunked_input = output.read()
+    assert (chunked_input[chunked_input.index('<region>'):]
+            == complete_input[complete_input.index('<region>'):])
+    assert (sorted(chunked_input.splitlines())
+            == sorted(complete_input.splitlines()))
+
+
+def test_write_stream_permissions(tmpdir):
+    """Test if write_stream creates the output with the current umask
+       and leaves the process umask alone"""
+    umask = os.umask(0o027)
+    try:
+        output_file = str(tmpdir.join('output.xml'))
+        fp.write_stream(['<root/>'], output_file)
+        assert os.umask(0o027) == 0o027
+    finally:
+        os.umask(umask)
+    assert os.stat(output_file).st_mode & 0o777 == 0o640
+    assert os.listdir(str(tmpdir)) == ['output.xml']
+
+
+def test_main_chunked_padded(tmpdir, monkeypatch):
+    """Test if main_chunked deploys the same reactors as main when the
+       csv file has padded fields"""
+    padded_file = padded_database(tmpdir)
+    countries = ['France', 'Czech_Republic']
+    render_region = fp.render_region
+    deployinst = []
+
+    def recording_render_region(*args):
+        deployinst.append(args)
+        return render_region(*args)
+    monkeypatch.setattr(fp, 'render_region', recording_render_region)
+    with tmpdir.as_cwd():
+        fp.main(padded_file, 19700101, 1200, countries, 'main.xml')
+        main_deployinst = deployinst[:]
+        del deployinst[:]
+        fp.main_chunked(padded_file, 19700101, 1200, countries,
+                        'chunked.xml', block_size=2)
+        with open('main.xml', 'r') as output:
+            complete_input = output.read()
+        with open('chunked.xml', 'r') as output:
+            chunked_input = output.read()
+    assert deployinst == main_deployinst
+    france = dict((args[0], args) for args in deployinst)['France']
+    assert france[1] == '<val>CIVAUX-2</val>\n'
+    assert france[4] == '<val>720</val>\n'
+    assert (sorted(chunked_input.splitlines())
+            == sorted(complete_input.splitlines()))
+
+
+def test_input_stream(tmpdir):
+    """Test if the streamed input file matches the rendered one"""
+    reactor_array = fp.read_csv(test_database_path, ['Czech_Republic'])
+    reactor_array['entry_time'] = 10
+    reactor_array['lifetime'] = 720
+    output_file = str(tmpdir.join('complete_input.xml'))
+    fp.input_render(19700101, 1200, fp.reactor_render(reactor_array),
+                    fp.region_render(reactor_array), output_file, True)
+    with open(output_file, 'r') as output:
+        rendered = output.read()
+    streamed = io.StringIO()
+    fp.write_stream(fp.input_stream(19700101, 1200,
+                                    fp.reactor_stream(reactor_array),
+                                    fp.region_stream(reactor_array), True),
+                    streamed)
+    assert streamed.getvalue() == rendered
+
+
+def test_group_by():
+    """Test if group_by indexes the rows of every country"""
+    test = np.array([(b'France', 1), (b'Spain', 2), (b'France', 3)],
+                    dtype=[('country', 'S10'), ('lifetime', 'i4')])
+    index = fp.group_by(test, 'country')
+    assert list(index.keys()) == ['France', 'Spain']
+    assert index['France'].tolist() == [0, 2]
+    assert index['Spain'].tolist() == [1]
+
+
+def test_region_render():
+    """Test if region_render renders the countries in sorted order
+       and leaves out countries without deployed reactors"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    reactor_array['lifetime'] = 720
+    reactor_array['lifetime'][0] = 0
+    region_input = fp.region_render(reactor_array)
+    assert region_input.count('<facility>') == 1
+    assert '<!-- Czech_Republic -->' in region_input
+
+
+def test_get_template():
+    """Test if templates are compiled once and cached"""
+    template = fp.get_template('pwr_template')
+    assert fp.get_template('pwr_template') is template
+    assert fp.read_template('{{ x }}') is fp.read_template('{{ x }}')
+
+
+def test_template_cache_dir(tmpdir):
+    """Test if the bytecode cache stores compiled templates on disk"""
+    try:
+        fp.set_template_cache_dir(str(tmpdir))
+        fp.get_template('candu_template')
+        assert len(os.listdir(str(tmpdir))) == 1
+    finally:
+        fp.set_template_cache_dir(None)
+
+
+def test_batch_main(tmpdir):
+    """Test if batch_main renders every scenario like main does"""
+    scenarios = [{'init_date': 19700101, 'duration': 1200,
+                  'country_list': ['France']},
+                 {'init_date': 20000101, 'duration': 600,
+                  'country_list': ['France', 'Czech_Republic'],
+                  'reprocessing': False, 'output_file': 'both.xml'}]
+    summary = fp.batch_main(test_database_path, scenarios, str(tmpdir),
+                            processes=2)
+    assert [entry['reactors'] for entry in summary] == [1, 3]
+    assert summary[1]['output_file'] == str(tmpdir.join('both.xml'))
+
+    main_file = str(tmpdir.join('main.xml'))
+    fp.main(test_database_path, 20000101, 600,
+            ['France', 'Czech_Republic'], main_file, False)
+    with open(main_file, 'r') as output:
+        answer = output.read()
+    with open(summary[1]['output_file'], 'r') as output:
+        assert output.read() == answer
+    assert os.path.exists(str(tmpdir.join('scenario_0.xml')))
+
+
+def test_main_concurrent(tmpdir):
+    """Test if concurrent main calls in one directory do not
+       interfere with each other"""
+    country_sets = [['France'], ['Czech_Republic'],
+                    ['France', 'Czech_Republic']] * 4
+    answers = []
+    for indx, countries in enumerate(country_sets[:3]):
+        output_file = str(tmpdir.join('serial_%i.xml' % indx))
+        fp.main(test_database_path, 19700101, 1200, countries, output_file)
+        with open(output_file, 'r') as output:
+            answers.append(output.read())
+
+    def run(indx):
+        output_file = str(tmpdir.join('thread_%i.xml' % indx))
+        fp.main(test_database_path, 19700101, 1200,
+                country_sets[indx], output_file)
+        with open(output_file, 'r') as output:
+            return output.read()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(run, range(len(country_sets))))
+    for indx, result in enumerate(results):
+        assert result == answers[indx % 3]
+    assert not [name for name in os.listdir(str(tmpdir))
+                if name.endswith('.tmp')]
+
+
+def test_ymd_array():
+    """Test if get_ymd_array matches get_ymd"""
+    year, month = fp.get_ymd_array([20180225, 20180301, -1])
+    assert list(zip(year, month)) == [fp.get_ymd(20180225),
+                                      fp.get_ymd(20180301),
+                                      fp.get_ymd(-1)]
+
+
+def test_lifetime_array():
+    """Test if get_lifetime_array calculates the right lifetimes"""
+    lifetime = fp.get_lifetime_array([19700101, 19700101, 19620829],
+                                     [20070225, -1, 19870630])
+    assert lifetime.tolist() == [446, 720,
+                                 fp.get_lifetime(19620829, 19870630)]
+
+
+def test_entrytime_array():
+    """Test if get_entrytime_array calculates the right entrytimes"""
+    entry_time = fp.get_entrytime_array(19700101, [20070225, 19600101])
+    assert entry_time.tolist() == [446, -120]
+
+
+def test_deployment_times():
+    """Test if get_deployment_times clamps reactors that start before
+       the simulation"""
+    entry_time, lifetime = fp.get_deployment_times(
+        19700101, [20070225, 19600101, 19500101],
+        [-1, 20000101, 19600101])
+    assert entry_time.tolist() == [446, 1, 1]
+    assert lifetime.tolist() == [720, 360, 0]
+
+
+def test_reactor_sizing():
+    """Test if reactor_sizing sizes known and unknown reactor types"""
+    sizing = fp.reactor_sizing(['PWR', 'BWR', 'GCR'], [1000, 1000, 1500])
+    assert sizing['template'] == ['pwr_template'] * 3
+    assert sizing['assem_size'] == [446.0, 180, 523.4]
+    assert sizing['n_assem_core'] == [193, 764, 290]
+    assert sizing['n_assem_batch'] == [64, 254, 96]
+
+
+def test_register_reactor_spec():
+    """Test if a registered reactor spec is used to size reactors"""
+    try:
+        fp.register_reactor_spec('MOX', 'mox_template', 400.0, 0.2, 0.05)
+        sizing = fp.reactor_sizing(['MOX'], [1000])
+        assert sizing['template'] == ['mox_template']
+        assert sizing['n_assem_core'] == [200]
+        assert '<name>MOXY</name>' in fp.reactor_render(np.array(
+            [(b'France', b'MOXY', b'MOX', 1000)],
+            dtype=[('country', 'S10'), ('reactor_name', 'S10'),
+                   ('type', 'S10'), ('net_elec_capacity', 'i4')]))
+    finally:
+        del fp.reactor_specs['MOX']
+
+
+def test_shared_prototype_names():
+    """Test if reactors of the same type and capacity share a prototype"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    prototypes, first_rows = fp.shared_prototype_names(reactor_array)
+    assert prototypes.tolist() == ['PWR_1495MWe', 'AP1000_1200MWe',
+                                   'AP1000_1200MWe']
+    assert first_rows.tolist() == [0, 1]
+
+
+def test_main_shared_prototypes(tmpdir):
+    """Test if main emits one facility per shared prototype and
+       writes the prototype map"""
+    output_file = str(tmpdir.join('shared.xml'))
+    fp.main(test_database_path, 19700101, 1200,
+            ['France', 'Czech_Republic'], output_file,
+            shared_prototypes=True)
+    with open(output_file, 'r') as output:
+        complete_input = output.read()
+    assert complete_input.count('<name>AP1000_1200MWe</name>') == 1
+    assert '<name>TEMELIN-3</name>' not in complete_input
+    with open(str(tmpdir.join('shared_prototypes.csv')), 'r') as map_file:
+        lines = map_file.read().splitlines()
+    assert lines[0] == 'country,reactor_name,prototype'
+    assert lines[3] == 'Czech_Republic,TEMELIN-4,AP1000_1200MWe'
+
+
+def test_country_fragments():
+    """Test if only countries whose data changed are re-rendered"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    reactor_array['entry_time'] = 1
+    reactor_array['lifetime'] = 720
+    fragments, rendered = fp.country_fragments(reactor_array)
+    assert rendered == ['Czech_Republic', 'France']
+    previous = {'version': fp.MANIFEST_VERSION, 'countries': fragments}
+
+    reactor_array['lifetime'][0] = 360
+    fragments, rendered = fp.country_fragments(reactor_array,
+                                               previous=previous)
+    assert rendered == ['France']
+    assert (fragments['Czech_Republic']
+            == previous['countries']['Czech_Republic'])
+
+
+def test_main_incremental(tmpdir):
+    """Test if incremental runs give the same output as full runs"""
+    countries = ['France', 'Czech_Republic']
+    full_file = str(tmpdir.join('full.xml'))
+    incremental_file = str(tmpdir.join('incremental.xml'))
+    for init_date in (19700101, 19700101, 20000101):
+        fp.main(test_database_path, init_date, 1200, countries, full_file)
+        fp.main(test_database_path, init_date, 1200, countries,
+                incremental_file, incremental=True)
+        with open(full_file, 'r') as full:
+            with open(incremental_file, 'r') as incremental:
+                assert full.read() == incremental.read()
+    assert os.path.exists(incremental_file + '.manifest.json')
+
+
+def test_main_parallel(tmpdir):
+    """Test if parallel rendering gives the same output as serial"""
+    countries = ['France', 'Czech_Republic']
+    serial_file = str(tmpdir.join('serial.xml'))
+    parallel_file = str(tmpdir.join('parallel.xml'))
+    fp.main(test_database_path, 19700101, 1200, countries, serial_file)
+    fp.main(test_database_path, 19700101, 1200, countries, parallel_file,
+            processes=2)
+    with open(serial_file, 'r') as serial:
+        with open(parallel_file, 'r') as parallel:
+            assert serial.read() == parallel.read()
+
+
+def test_parallel_without_hashes(tmpdir, monkeypatch):
+    """Test if parallel rendering skips the content hashes when no
+       manifest is written"""
+    def failing_digest(*args):
+        raise AssertionError('content hash computed')
+    monkeypatch.setattr(fp, '_digest_rows', failing_digest)
+    output_file = str(tmpdir.join('parallel.xml'))
+    fp.main(test_database_path, 19700101, 1200,
+            ['France', 'Czech_Republic'], output_file, processes=2)
+    assert os.listdir(str(tmpdir)) == ['parallel.xml']
+
+
+def test_country_fragments_blocks():
+    """Test if facility blocks split over tasks are merged in order"""
+    reactor_array = fp.read_csv(test_database_path,
+                                ['France', 'Czech_Republic'])
+    reactor_array['entry_time'] = 1
+    reactor_array['lifetime'] = 720
+    fragments = fp.country_fragments(reactor_array, processes=2,
+                                     block_size=1)[0]
+    assert (fragments['Czech_Republic']['facilities']
+            == fp.reactor_render(reactor_array[1:]))